@@ -0,0 +1,75 @@
+"""
+Micro-benchmark of the per page CPU cost of decoding a large issues page,
+comparing the previous response handling (res.text, then res.json(), then
+splitting response_item) with decoding res.content once per available decoder.
+
+python -m benchmarks.decode
+"""
+import json
+import timeit
+from requests import Response
+from requests.structures import CaseInsensitiveDict
+from sonarqube.api import Endpoint
+from sonarqube.utils import JSON_DECODERS, json_decoder
+
+
+def issues_page(size=500):
+    issue = {
+        'key': 'AXyz0123456789abcdef', 'rule': 'python:S1192', 'severity': 'MINOR',
+        'component': 'my-project:src/module/file.py', 'project': 'my-project', 'line': 42,
+        'hash': '0123456789abcdef0123456789abcdef', 'status': 'OPEN', 'message': 'Define a constant instead of duplicating this literal “x” 3 times.',
+        'effort': '6min', 'debt': '6min', 'author': 'dev@example.com', 'tags': ['design'],
+        'creationDate': '2022-01-01T10:00:00+0000', 'updateDate': '2022-01-02T10:00:00+0000', 'type': 'CODE_SMELL',
+        'textRange': {'startLine': 42, 'endLine': 42, 'startOffset': 4, 'endOffset': 9},
+        'flows': [{'locations': [{'component': 'my-project:src/module/file.py', 'msg': 'Duplication',
+                                  'textRange': {'startLine': n, 'endLine': n, 'startOffset': 4, 'endOffset': 9}}]}
+                  for n in range(3)],
+        'comments': [{'key': 'c1', 'login': 'dev', 'htmlText': 'Looking into it', 'createdAt': '2022-01-03T10:00:00+0000'}]
+    }
+    return {'total': 20000, 'p': 1, 'ps': size,
+            'paging': {'pageIndex': 1, 'pageSize': size, 'total': 20000},
+            'issues': [dict(issue, key=f'AXyz{n:016d}') for n in range(size)]}
+
+
+def response(content):
+    res = Response()
+    res.status_code = 200
+    res.headers = CaseInsensitiveDict({'Content-Type': 'application/json;charset=utf-8'})
+    res._content = content
+    return res
+
+
+def previous(content, response_item):
+    res = response(content)
+    json = None
+    if (res.text):
+        json = res.json()
+        for item in response_item.split('.'):
+            json = json[item]
+    return json
+
+
+def current(content, endpoint, loads):
+    res = response(content)
+    return endpoint.item(loads(res.content))
+
+
+def main(number=20):
+    content = json.dumps(issues_page(), ensure_ascii=False).encode('utf-8')
+    endpoint = Endpoint('/api/issues/search', response_item='paging')
+    print(f'issues page of {len(content) / 1024:.0f} KiB, best of 5 x {number} decodes')
+
+    baseline = min(timeit.repeat(lambda: previous(content, 'paging'), number=number, repeat=5)) / number
+    print(f'{"text + json()":>16}: {baseline * 1000:7.2f} ms/page')
+    for name in JSON_DECODERS:
+        try:
+            loads = json_decoder(name)
+        except ImportError:
+            print(f'{name:>16}: not installed')
+            continue
+        elapsed = min(timeit.repeat(lambda: current(content, endpoint, loads), number=number, repeat=5)) / number
+        print(f'{name:>16}: {elapsed * 1000:7.2f} ms/page ({baseline / elapsed:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,281 @@
+"""
+A local stand-in for a SonarQube server, serving synthetic data for the
+endpoints the benchmarks exercise: issues and projects searches, measures,
+quality gates and profiles, and project creation.
+
+The server runs in its own process so its JSON encoding doesn't compete with
+the client for the GIL. Pages are paged and capped like SonarQube's, and
+latency, errors and throttling can be injected:
+
+with serve(issues=20000, latency=0.02, throttle_rate=0.05) as url:
+    sq = SonarQube(url=url)
+
+python -m benchmarks.server --port 9000 --issues 50000
+"""
+import argparse
+import json
+import multiprocessing
+import random
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# Like SonarQube: default and largest page sizes, and results that can be paged through
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+MAX_RESULTS = 10000
+
+SEVERITIES = ('INFO', 'MINOR', 'MAJOR', 'CRITICAL', 'BLOCKER')
+TYPES = ('CODE_SMELL', 'BUG', 'VULNERABILITY')
+EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+
+class Dataset:
+
+    """
+    Deterministic synthetic issues, projects and measures. Issues are spread
+    over the projects and created an hour apart.
+    """
+
+    def __init__(self, issues=20000, projects=1000, history=100):
+        self.issues = issues
+        self.history = history
+        self.projects = {f'project-{n:05d}': {'key': f'project-{n:05d}', 'name': f'Project {n}',
+                                              'qualifier': 'TRK', 'visibility': 'public'}
+                         for n in range(projects)}
+        self.gates = {}
+        self.profiles = {}
+        self.lock = threading.Lock()
+
+    def issue(self, n):
+        created = EPOCH + timedelta(hours=n)
+        project = f'project-{n % max(1, len(self.projects)):05d}'
+        return {
+            'key': f'AX{n:018d}', 'rule': f'python:S{1000 + n % 400}', 'severity': SEVERITIES[n % 5],
+            'component': f'{project}:src/module_{n % 50}/file_{n % 7}.py', 'project': project,
+            'line': 1 + n % 500, 'hash': f'{n:032x}', 'status': 'OPEN',
+            'message': 'Define a constant instead of duplicating this literal 3 times.',
+            'effort': f'{1 + n % 30}min', 'debt': f'{1 + n % 30}min', 'author': f'dev{n % 20}@example.com',
+            'tags': ['design'], 'type': TYPES[n % 3],
+            'creationDate': created.strftime('%Y-%m-%dT%H:%M:%S+0000'),
+            'updateDate': (created + timedelta(days=1)).strftime('%Y-%m-%dT%H:%M:%S+0000'),
+            'textRange': {'startLine': 1 + n % 500, 'endLine': 1 + n % 500, 'startOffset': 4, 'endOffset': 9},
+        }
+
+    def measure(self, project, metric, n=0):
+        return str(zlib.crc32(f'{project}:{metric}:{n}'.encode()) % 10000 / 100)
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    # set on the handler class served
+    dataset = None
+    latency = 0.0
+    error_rate = 0.0
+    throttle_rate = 0.0
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately, don't let them wait on delayed ACKs
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self._handle()
+
+    def _handle(self):
+        url = urlsplit(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if self.latency:
+            time.sleep(self.latency)
+        draw = random.random()
+        if draw < self.throttle_rate:
+            return self._send(429, {'errors': [{'msg': 'Too many requests'}]}, {'Retry-After': '0'})
+        if draw < self.throttle_rate + self.error_rate:
+            return self._send(503, {'errors': [{'msg': 'Service unavailable'}]})
+        route = ROUTES.get(url.path)
+        if route is None:
+            return self._send(404, {'errors': [{'msg': f'Unknown url : {url.path}'}]})
+        try:
+            body = route(self.dataset, params)
+            self._send(200 if body is not None else 204, body)
+        except ValueError as e:
+            self._send(400, {'errors': [{'msg': str(e)}]})
+
+    def _send(self, status, body, headers=None):
+        content = json.dumps(body).encode('utf-8') if body is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json;charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+
+def _page(params, total, max_size=MAX_PAGE_SIZE):
+    page = int(params.get('p', 1))
+    size = int(params.get('ps', DEFAULT_PAGE_SIZE))
+    if size > max_size:
+        raise ValueError(f"'ps' value ({size}) must be less than {max_size}")
+    if page * size > MAX_RESULTS:
+        raise ValueError(f'Can return only the first {MAX_RESULTS} results. '
+                         f'{page * size}th result asked.')
+    start = (page - 1) * size
+    return range(start, min(start + size, total)), {'pageIndex': page, 'pageSize': size, 'total': total}
+
+
+def issues_search(dataset, params):
+    keys, paging = _page(params, dataset.issues)
+    return {'total': paging['total'], 'p': paging['pageIndex'], 'ps': paging['pageSize'], 'paging': paging,
+            'issues': [dataset.issue(n) for n in keys], 'components': [], 'facets': []}
+
+
+def projects_search(dataset, params):
+    with dataset.lock:
+        projects = sorted(dataset.projects)
+    if 'projects' in params:
+        wanted = set(params['projects'].split(','))
+        projects = [key for key in projects if key in wanted]
+    if 'q' in params:
+        projects = [key for key in projects if params['q'] in key]
+    keys, paging = _page(params, len(projects))
+    return {'paging': paging, 'components': [dataset.projects[projects[n]] for n in keys]}
+
+
+def projects_create(dataset, params):
+    project = {'key': params['project'], 'name': params['name'], 'qualifier': 'TRK', 'visibility': 'public'}
+    with dataset.lock:
+        dataset.projects[project['key']] = project
+    return {'project': project}
+
+
+def measures_search(dataset, params):
+    return {'measures': [{'component': project, 'metric': metric, 'value': dataset.measure(project, metric)}
+                         for project in params['projectKeys'].split(',')
+                         for metric in params['metricKeys'].split(',')]}
+
+
+def measures_component(dataset, params):
+    project = params['component']
+    return {'component': {'key': project, 'measures': [{'metric': metric, 'value': dataset.measure(project, metric)}
+                                                       for metric in params['metricKeys'].split(',')]}}
+
+
+def measures_history(dataset, params):
+    project = params['component']
+    dates, paging = _page(params, dataset.history, max_size=1000)
+    return {'paging': paging,
+            'measures': [{'metric': metric,
+                          'history': [{'date': (EPOCH + timedelta(days=n)).strftime('%Y-%m-%dT%H:%M:%S+0000'),
+                                       'value': dataset.measure(project, metric, n)} for n in dates]}
+                         for metric in params['metrics'].split(',')]}
+
+
+def project_status(dataset, params):
+    project = params.get('projectKey', '')
+    return {'projectStatus': {'status': 'ERROR' if zlib.crc32(project.encode()) % 10 == 0 else 'OK',
+                              'conditions': []}}
+
+
+def gate_by_project(dataset, params):
+    with dataset.lock:
+        return {'qualityGate': {'name': dataset.gates.get(params['project'], 'Sonar way'), 'default': True}}
+
+
+def gate_select(dataset, params):
+    with dataset.lock:
+        dataset.gates[params['projectKey']] = params['gateName']
+    return None
+
+
+def profiles_search(dataset, params):
+    with dataset.lock:
+        profiles = dataset.profiles.get(params.get('project'), {'py': 'Sonar way'})
+    return {'profiles': [{'language': language, 'name': name} for language, name in profiles.items()]}
+
+
+def profiles_add_project(dataset, params):
+    with dataset.lock:
+        dataset.profiles.setdefault(params['project'], {'py': 'Sonar way'})[params['language']] = \
+            params['qualityProfile']
+    return None
+
+
+ROUTES = {
+    '/api/issues/search': issues_search,
+    '/api/projects/search': projects_search,
+    '/api/projects/create': projects_create,
+    '/api/measures/search': measures_search,
+    '/api/measures/component': measures_component,
+    '/api/measures/search_history': measures_history,
+    '/api/qualitygates/project_status': project_status,
+    '/api/qualitygates/get_by_project': gate_by_project,
+    '/api/qualitygates/select': gate_select,
+    '/api/qualityprofiles/search': profiles_search,
+    '/api/qualityprofiles/add_project': profiles_add_project,
+}
+
+
+class Server(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients closing pooled connections at exit
+        pass
+
+
+def run(port=0, ready=None, issues=20000, projects=1000, history=100, latency=0.0, error_rate=0.0,
+        throttle_rate=0.0, seed=0):
+    random.seed(seed)
+    handler = type('BoundHandler', (Handler,), {
+        'dataset': Dataset(issues, projects, history), 'latency': latency,
+        'error_rate': error_rate, 'throttle_rate': throttle_rate,
+    })
+    server = Server(('127.0.0.1', port), handler)
+    if ready is not None:
+        ready.put(server.server_address[1])
+    server.serve_forever()
+
+
+@contextmanager
+def serve(**options):
+    """
+    Run the server in a child process for the duration of the block,
+    yielding its url. Takes the keyword arguments of run.
+    """
+    ready = multiprocessing.Queue()
+    process = multiprocessing.Process(target=run, kwargs=dict(options, ready=ready), daemon=True)
+    process.start()
+    try:
+        yield f'http://127.0.0.1:{ready.get(timeout=30)}'
+    finally:
+        process.terminate()
+        process.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve synthetic SonarQube data')
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--issues', type=int, default=20000)
+    parser.add_argument('--projects', type=int, default=1000)
+    parser.add_argument('--history', type=int, default=100, help='Analyses in each measures history')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to each request')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests failing with 503')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='Share of requests throttled with 429')
+    args = parser.parse_args()
+    print(f'Serving synthetic SonarQube on http://127.0.0.1:{args.port}')
+    run(args.port, None, args.issues, args.projects, args.history, args.latency, args.error_rate,
+        args.throttle_rate)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+"""
+End to end benchmarks of the SonarQube adapter against the synthetic server
+in benchmarks.server: paging issues and projects (serially, prefetching and
+streaming), measures, quality gates and Project.create_or_update, on a fast
+server and on a slow, throttling one.
+
+Each benchmark records its throughput, time to first item, requests sent and
+peak memory, appended as JSON lines to the results file along with the
+package version and git commit, and compared with the previous record of the
+same benchmark so regressions show up between releases.
+
+python -m benchmarks.suite
+python -m benchmarks.suite --latency 0.05 --only issues
+"""
+import argparse
+import json
+import logging
+import platform
+import re
+import subprocess
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from importlib import metadata
+from sonarqube.api import SonarQube
+from sonarqube.community import Project
+from sonarqube.metrics import Metrics
+from sonarqube.resilience import RetryPolicy
+from .server import serve
+
+METRIC_KEYS = ['coverage', 'bugs', 'code_smells', 'ncloc']
+
+
+def issues(sq):
+    return sq.get_issues()
+
+
+def projects(sq):
+    return sq.get_projects_search()
+
+
+def portfolio_measures(sq):
+    return sq.portfolio_measures(METRIC_KEYS).projects
+
+
+def measures_history(sq):
+    keys = [project['key'] for project in sq.get_projects_search(ps=50)][:50]
+    return sq.measures_history(keys, METRIC_KEYS).items()
+
+
+def gate_statuses(sq):
+    keys = [project['key'] for project in sq.get_projects_search(ps=500)][:500]
+    return sq.gate_statuses(keys).items()
+
+
+def create_or_update(sq):
+    # half the projects exist already, all of them get a gate and a profile assigned
+    projects = [Project(key=f'project-{n:05d}', name=f'Project {n}', suffix=None if n < 100 else 'bench',
+                        quality_gate='Strict', quality_profiles={'py': 'Strict'}, sq=sq) for n in range(200)]
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        return list(executor.map(lambda project: project.create_or_update(), projects))
+
+
+# name: (client options, benchmark)
+BENCHMARKS = {
+    'issues-serial': ({}, issues),
+    'issues-prefetch': ({'page_workers': 8}, issues),
+    'issues-streaming': ({'streaming': True}, issues),
+    'projects-serial': ({}, projects),
+    'projects-prefetch': ({'page_workers': 8}, projects),
+    'portfolio-measures': ({}, portfolio_measures),
+    'measures-history': ({}, measures_history),
+    'gate-statuses': ({'thread_safe': True}, gate_statuses),
+    'create-or-update': ({'thread_safe': True, 'pool_maxsize': 16}, create_or_update),
+}
+
+
+def run(name, url, client_options, benchmark, memory=True):
+    """
+    Run a benchmark, iterating what it returns, and measure it.
+    """
+    metrics = Metrics()
+    sq = SonarQube(url=url, metrics=metrics, **client_options)
+    start = time.perf_counter()
+    first = None
+    count = 0
+    for _ in benchmark(sq):
+        if first is None:
+            first = time.perf_counter() - start
+        count += 1
+    elapsed = time.perf_counter() - start
+    sent = metrics.as_dict().values()
+    result = {
+        'benchmark': name, 'items': count, 'seconds': round(elapsed, 4),
+        'items_per_second': round(count / elapsed, 1),
+        'first_item_seconds': round(first, 4) if first is not None else None,
+        'requests': sum(endpoint['requests'] for endpoint in sent),
+        'retries': sum(endpoint['retries'] for endpoint in sent),
+    }
+    sq.close()
+
+    if memory:
+        # a second run, tracing allocations slows the client down too much to time it
+        sq = SonarQube(url=url, **client_options)
+        tracemalloc.start()
+        for _ in benchmark(sq):
+            pass
+        result['peak_memory_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        sq.close()
+    return result
+
+
+def environment():
+    try:
+        version = metadata.version('sonarqube-py')
+    except metadata.PackageNotFoundError:
+        # running from a checkout
+        with open('pyproject.toml') as pyproject:
+            version = re.search(r'^version = "(.*)"', pyproject.read(), re.MULTILINE).group(1)
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'version': version, 'commit': commit, 'python': platform.python_version(),
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds')}
+
+
+def previous_results(filename):
+    # last record of each benchmark and server setup
+    previous = {}
+    try:
+        with open(filename) as results:
+            for line in results:
+                record = json.loads(line)
+                previous[(record['benchmark'], json.dumps(record['server'], sort_keys=True))] = record
+    except FileNotFoundError:
+        pass
+    return previous
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the SonarQube adapter against a synthetic server')
+    parser.add_argument('--issues', type=int, default=10000)
+    parser.add_argument('--projects', type=int, default=2000)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds the server adds to each request')
+    parser.add_argument('--throttle-rate', type=float, default=0.05,
+                        help='Share of requests throttled (or failing) in the slow server runs')
+    parser.add_argument('--only', help='Only run benchmarks whose name contains this')
+    parser.add_argument('--no-memory', dest='memory', action='store_false', help='Skip the peak memory runs')
+    parser.add_argument('--output', default='benchmarks/results.jsonl', help='JSON lines file results are added to')
+    args = parser.parse_args()
+    # retries on the throttling server are expected
+    logging.basicConfig(level=logging.ERROR)
+
+    servers = {
+        'fast': {'issues': args.issues, 'projects': args.projects, 'latency': args.latency},
+        'throttling': {'issues': args.issues, 'projects': args.projects, 'latency': max(args.latency, 0.01),
+                       'throttle_rate': args.throttle_rate, 'error_rate': args.throttle_rate / 5},
+    }
+    # the throttling server needs retries, and tells us how well they hold up
+    retry = {'fast': {}, 'throttling': {'retry': RetryPolicy(retries=8, backoff=0.05, methods=('GET', 'POST'))}}
+
+    env = environment()
+    previous = previous_results(args.output)
+    print(f'sonarqube-py {env["version"]} ({env["commit"]}), python {env["python"]}')
+    print(f'{"benchmark":<30} {"items/s":>10} {"first ms":>9} {"requests":>9} {"peak KiB":>9} {"change":>8}')
+    with open(args.output, 'a') as output:
+        for server, server_options in servers.items():
+            with serve(**server_options) as url:
+                for name, (client_options, benchmark) in BENCHMARKS.items():
+                    if args.only and args.only not in name:
+                        continue
+                    result = run(name, url, dict(client_options, **retry[server]), benchmark, args.memory)
+                    record = dict(env, server=dict(server_options, name=server), **result)
+                    output.write(json.dumps(record) + '\n')
+
+                    before = previous.get((name, json.dumps(record['server'], sort_keys=True)))
+                    change = f'{result["items_per_second"] / before["items_per_second"] - 1:+.0%}' \
+                        if before and before['items_per_second'] else ''
+                    peak = f'{result["peak_memory_bytes"] / 1024:.0f}' if 'peak_memory_bytes' in result else '-'
+                    first = f'{1000 * result["first_item_seconds"]:.1f}' \
+                        if result['first_item_seconds'] is not None else '-'
+                    print(f'{server + "/" + name:<30} {result["items_per_second"]:>10} {first:>9} '
+                          f'{result["requests"]:>9} {peak:>9} {change:>8}')
+
+
+if __name__ == '__main__':
+    main()
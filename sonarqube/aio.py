@@ -0,0 +1,141 @@
+"""
+This module contains an asyncio adapter for the SonarQube web service API,
+for keeping many requests in flight from a single event loop.
+
+It needs aiohttp, which is not installed with sonarqube-py:
+pip install aiohttp
+"""
+import asyncio
+import logging
+from collections import deque
+from requests import Response
+from requests.structures import CaseInsensitiveDict
+from .api import BaseSonarQube
+from .exceptions import raise_for_status
+from .utils import json_decoder as _json_decoder
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+logger = logging.getLogger('sonarqube.aio')
+
+
+class AsyncSonarQube(BaseSonarQube):
+
+    """
+    Asyncio adapter for SonarQube's web service API.
+
+    Shares its endpoints with SonarQube: get/post/delete and the get_*/post_*
+    methods are awaitable, paged endpoints return async iterators.
+    Use as an async context manager, or await close() when done.
+    """
+
+    def __init__(self, url=None, host=None, port=None, user=None, password=None,
+                 base_path=None, token=None, concurrency=10, json_decoder=None):
+        """
+        Set connection info and auth; the aiohttp session is created on first use.
+
+        :param concurrency: maximum number of requests in flight at once
+        :param json_decoder: as for SonarQube
+        """
+        if aiohttp is None:
+            raise ImportError('AsyncSonarQube requires aiohttp: pip install aiohttp')
+        super().__init__(url, host, port, user, password, base_path, token)
+        credentials = self._credentials()
+        self._auth = aiohttp.BasicAuth(*credentials) if credentials else None
+        self._concurrency = concurrency
+        self._loads = json_decoder if callable(json_decoder) else _json_decoder(json_decoder)
+        self._semaphore = None
+        self._session = None
+        logger.info(f'SonarQube at [{self._url}]')
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        if self._session:
+            await self._session.close()
+            self._session = None
+
+    def _client(self):
+        # Created lazily so they bind to the running event loop
+        if self._session is None:
+            self._semaphore = asyncio.Semaphore(self._concurrency)
+            self._session = aiohttp.ClientSession(auth=self._auth)
+        return self._session
+
+    async def post(self, endpoint, **data):
+        return await self.call('POST', endpoint, **data)
+
+    async def get(self, endpoint, **data):
+        return await self.call('GET', endpoint, **data)
+
+    async def delete(self, endpoint, **data):
+        return await self.call('DELETE', endpoint, **data)
+
+    async def call(self, method, endpoint, **data):
+        session = self._client()
+        async with self._semaphore:
+            async with session.request(method, self.endpoint_url(endpoint), params=_params(data)) as res:
+                body = await res.read()
+                response = _to_response(res, body)
+
+        # Same status to exception mapping as the blocking adapter
+        raise_for_status(response)
+
+        json = None
+        if body:
+            json = endpoint.item(self._loads(body))
+        return json
+
+    async def paged_get(self, endpoint, **data):
+
+        qs = data.copy()
+        pager = endpoint.pager
+        qs.setdefault(pager.request_page_size, pager.max_page_size)
+
+        # First page tells us how many pages there are
+        res = await self.get(endpoint, **qs)
+        self._warn_if_truncated(endpoint, res)
+        for item in pager.items(res):
+            yield item
+
+        # Request the remaining pages ahead of the consumer, yielding in page order
+        pending = deque()
+        try:
+            for page in range(pager.page_index(res) + 1, pager.last_page(res) + 1):
+                qs[pager.request_page_number] = page
+                pending.append(asyncio.ensure_future(self.get(endpoint, **qs)))
+                if len(pending) >= self._concurrency:
+                    for item in pager.items(await pending.popleft()):
+                        yield item
+            while pending:
+                for item in pager.items(await pending.popleft()):
+                    yield item
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+def _params(data):
+    # aiohttp only takes str values; expand lists into repeated keys like requests does
+    params = []
+    for key, value in data.items():
+        for v in value if isinstance(value, (list, tuple)) else [value]:
+            params.append((key, v if isinstance(v, str) else str(v)))
+    return params
+
+
+def _to_response(res, body):
+    response = Response()
+    response.status_code = res.status
+    response.reason = res.reason
+    response.headers = CaseInsensitiveDict(res.headers)
+    response.url = str(res.url)
+    response._content = body
+    return response
@@ -2,26 +2,55 @@
 This module contains the SonarAPIHandler, used for communicating with the
 SonarQube server web service API.
 """
+import heapq
 import requests
 import logging
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from os import environ as env
+from requests.adapters import HTTPAdapter
+from .cache import CacheEntry, SingleFlight, cache_key, cache_scope
 from .exceptions import raise_for_status
+from .resilience import RetryPolicy
+from .stream import StreamedPage
+from .utils import bounded_map, chunked, format_date, json_decoder as _json_decoder, parse_date
 
 logger = logging.getLogger('sonarqube.api')
 
 class Endpoint:
 
-    def __init__(self, path, response_item=None, pager=None):
+    def __init__(self, path, response_item=None, pager=None, cache_ttl=None, invalidates=()):
+        """
+        :param cache_ttl: seconds a response may be served from the adapter's cache
+        :param invalidates: endpoints whose cached responses are dropped when this one is called
+        """
         self.path = path
         self.response_item = response_item
         self.pager = pager
+        self.cache_ttl = cache_ttl
+        self._response_path = tuple(response_item.split('.')) if response_item else ()
+        self.invalidates = invalidates
+
+    def item(self, response):
+        # Walk the dotted response_item path, None if the response is empty or any part is missing
+        for item in self._response_path:
+            if response is not None and item in response:
+                response = response[item]
+            else:
+                return None
+        return response
 
 
 class Pager:
 
     def __init__(self, response_items, request_page_number='p', request_page_size='ps',
                  response_object='paging', response_page_index='pageIndex',
-                 response_page_size='pageSize', response_total='total'):
+                 response_page_size='pageSize', response_total='total',
+                 max_page_size=500, max_results=10000):
         self.response_items = response_items
         self.request_page_number = request_page_number
         self.request_page_size = request_page_size
@@ -29,6 +58,8 @@ class Pager:
         self.response_page_index = response_page_index
         self.response_page_size = response_page_size
         self.response_total = response_total
+        self.max_page_size = max_page_size
+        self.max_results = max_results
 
     def paging(self, response):
         return response[self.response_object] if self.response_object else response
@@ -44,15 +75,21 @@ class Pager:
 
     def has_next_page(self, response):
         if response:
-            total = self.total(response)
-            if total > 10000:
-                total = 10000
+            total = min(self.total(response), self.max_results)
             page_size = self.page_size(response)
             page_num = self.page_index(response)
             return page_num * page_size < total
         else:
             return True
 
+    def truncated(self, response):
+        return self.total(response) > self.max_results
+
+    def last_page(self, response):
+        total = min(self.total(response), self.max_results)
+        page_size = self.page_size(response)
+        return -(-total // page_size) if page_size else self.page_index(response)
+
     def next_page_number(self, response, data):
         page_number = self.page_index(response)
         data[self.request_page_number] = page_number + 1
@@ -61,10 +98,10 @@ class Pager:
         return response[self.response_items]
 
 
-class SonarQube:
+class BaseSonarQube:
 
     """
-    Adapter for SonarQube's web service API.
+    Connection info and endpoints shared by the SonarQube adapters.
     """
     # Default host is local
     DEFAULT_HOST = env.get('SONAR_HOST', 'http://localhost')
@@ -74,50 +111,58 @@ class SonarQube:
     DEFAULT_PASSWORD = env.get('SONAR_PASSWORD')
     DEFAULT_BASE_PATH = ''
 
-    AUTH_VALIDATION_ENDPOINT = Endpoint('/api/authentication/validate', response_item='valid')
-    PROJECTS_CREATE_ENDPOINT = Endpoint('/api/projects/create', response_item='project')
-    PROJECTS_DELETE_ENDPOINT = Endpoint('/api/projects/delete', response_item=None)
+    AUTH_VALIDATION_ENDPOINT = Endpoint('/api/authentication/validate', response_item='valid', cache_ttl=60)
     PROJECTS_ENDPOINT = Endpoint('/api/projects/search', pager=Pager(response_items='components'))
     ISSUES_ENDPOINT = Endpoint('/api/issues/search', pager=Pager(response_items='issues'))
     MEASURES_ENDPOINT = Endpoint('/api/measures/component', response_item='component.measures')
-    RULE_ENDPOINT = Endpoint('/api/rules/show', response_item='rule')
-    QUALITYGATES_SELECT_ENDPOINT = Endpoint('/api/qualitygates/select', response_item=None)
+    MEASURES_SEARCH_ENDPOINT = Endpoint('/api/measures/search', response_item='measures')
+    MEASURES_HISTORY_ENDPOINT = Endpoint('/api/measures/search_history',
+                                         pager=Pager(response_items='measures', max_page_size=1000))
+    RULE_ENDPOINT = Endpoint('/api/rules/show', response_item='rule', cache_ttl=3600)
+    RULES_SEARCH_ENDPOINT = Endpoint('/api/rules/search', pager=Pager(response_items='rules'))
     QUALITYGATES_PROJECT_STATUS_ENDPOINT = Endpoint('/api/qualitygates/project_status', response_item='projectStatus')
     QUALITYGATES_LIST_ENDPOINT = Endpoint('/api/qualitygates/list', pager=Pager(response_items='components'))
-    QUALITYGATES_GET_BY_PROJECT_ENDPOINT = Endpoint('/api/qualitygates/get_by_project', response_item='qualityGate')
-    QUALITYPROFILES_SEARCH_ENDPOINT = Endpoint('/api/qualityprofiles/search', response_item='profiles')
-    QUALITYPROFILES_ADD_PROJECT_ENDPOINT = Endpoint('/api/qualityprofiles/add_project', response_item='profiles')
+    QUALITYGATES_GET_BY_PROJECT_ENDPOINT = Endpoint('/api/qualitygates/get_by_project', response_item='qualityGate',
+                                                    cache_ttl=300)
+    QUALITYGATES_SELECT_ENDPOINT = Endpoint('/api/qualitygates/select', response_item=None,
+                                            invalidates=(QUALITYGATES_GET_BY_PROJECT_ENDPOINT,))
+    QUALITYPROFILES_SEARCH_ENDPOINT = Endpoint('/api/qualityprofiles/search', response_item='profiles', cache_ttl=300)
+    QUALITYPROFILES_ADD_PROJECT_ENDPOINT = Endpoint('/api/qualityprofiles/add_project', response_item='profiles',
+                                                    invalidates=(QUALITYPROFILES_SEARCH_ENDPOINT,))
+    CE_TASK_ENDPOINT = Endpoint('/api/ce/task', response_item='task')
+    CE_COMPONENT_ENDPOINT = Endpoint('/api/ce/component')
+    PROJECTS_CREATE_ENDPOINT = Endpoint('/api/projects/create', response_item='project')
+    PROJECTS_BULK_DELETE_ENDPOINT = Endpoint('/api/projects/bulk_delete', response_item=None,
+                                             invalidates=(QUALITYGATES_GET_BY_PROJECT_ENDPOINT,
+                                                          QUALITYPROFILES_SEARCH_ENDPOINT))
+    PROJECTS_DELETE_ENDPOINT = Endpoint('/api/projects/delete', response_item=None,
+                                        invalidates=(QUALITYGATES_GET_BY_PROJECT_ENDPOINT,
+                                                     QUALITYPROFILES_SEARCH_ENDPOINT))
 
     def __init__(self, url=None, host=None, port=None, user=None, password=None,
                  base_path=None, token=None):
-        """
-        Set connection info and session, including auth (if user+password
-        and/or auth token were provided).
-        """
         self._url = self._to_url(url, host, port, base_path)
-        self._token = token or SonarQube.DEFAULT_TOKEN
-        self._user = user or SonarQube.DEFAULT_USER
-        self._password = password or SonarQube.DEFAULT_PASSWORD
-        self._session = requests.Session()
-        self._auth()
-        logger.info(f'SonarQube at [{self._url}]')
+        self._token = token or self.DEFAULT_TOKEN
+        self._user = user or self.DEFAULT_USER
+        self._password = password or self.DEFAULT_PASSWORD
 
-    def _auth(self):
+    def _credentials(self):
         # Prefer revocable authentication token over username/password if
         # both are provided
         if self._token:
             logger.info('Authenticating with token')
-            self._session.auth = self._token, ''
+            return self._token, ''
         elif self._user and self._password:
             logger.info('Authenticating with username/password')
-            self._session.auth = self._user, self._password
+            return self._user, self._password
         else:
             logger.info('Authentication not set')
-            
+            return None
+
     def _to_url(self, url=None, host=None, port=None, base_path=None):
         if (url):
             return url
-        return f'{host or SonarQube.DEFAULT_HOST}:{port or SonarQube.DEFAULT_PORT}{base_path or SonarQube.DEFAULT_BASE_PATH}'
+        return f'{host or self.DEFAULT_HOST}:{port or self.DEFAULT_PORT}{base_path or self.DEFAULT_BASE_PATH}'
         
         
     def endpoint_url(self, endpoint):
@@ -129,37 +174,339 @@ class SonarQube:
         """
         return f'{self._url}{endpoint.path}'
 
+    def _warn_if_truncated(self, endpoint, res):
+        pager = endpoint.pager
+        if pager.truncated(res):
+            logger.warning(f'[{endpoint.path}] matched {pager.total(res)} items, '
+                           f'only the first {pager.max_results} can be paged')
+
+    def get_authentication_validate(self):
+        return self.get(BaseSonarQube.AUTH_VALIDATION_ENDPOINT)
+
+    def post_projects_create(self, **args):
+        return self.post(BaseSonarQube.PROJECTS_CREATE_ENDPOINT, **args)
+
+    def post_projects_delete(self, **args):
+        return self.post(BaseSonarQube.PROJECTS_DELETE_ENDPOINT, **args)
+
+    def post_projects_bulk_delete(self, **args):
+        return self.post(BaseSonarQube.PROJECTS_BULK_DELETE_ENDPOINT, **args)
+    
+    def get_projects_search(self, **args):
+        return self.paged_get(BaseSonarQube.PROJECTS_ENDPOINT, **args)
+
+    def get_issues(self, **args):
+        return self.paged_get(BaseSonarQube.ISSUES_ENDPOINT, **args)
+
+    def get_measures(self, **args):
+        return self.get(BaseSonarQube.MEASURES_ENDPOINT, **args)
+
+    def get_measures_search(self, **args):
+        return self.get(BaseSonarQube.MEASURES_SEARCH_ENDPOINT, **args)
+
+    def get_measures_search_history(self, **args):
+        return self.paged_get(BaseSonarQube.MEASURES_HISTORY_ENDPOINT, **args)
+
+    def get_rule(self, **args):
+        return self.get(BaseSonarQube.RULE_ENDPOINT, **args)
+
+    def get_rules_search(self, **args):
+        return self.paged_get(BaseSonarQube.RULES_SEARCH_ENDPOINT, **args)
+
+    def post_qualitygates_select(self, **args):
+        return self.post(BaseSonarQube.QUALITYGATES_SELECT_ENDPOINT, **args)
+
+    def get_qualitygates_project_status(self, **args):
+        return self.get(BaseSonarQube.QUALITYGATES_PROJECT_STATUS_ENDPOINT, **args)
+
+    def get_qualitygates_get_by_project(self, **args):
+        return self.get(BaseSonarQube.QUALITYGATES_GET_BY_PROJECT_ENDPOINT, **args)
+
+    def get_ce_task(self, **args):
+        return self.get(BaseSonarQube.CE_TASK_ENDPOINT, **args)
+
+    def get_ce_component(self, **args):
+        return self.get(BaseSonarQube.CE_COMPONENT_ENDPOINT, **args)
+
+    def get_qualityprofiles_search(self, **args):
+        return self.get(BaseSonarQube.QUALITYPROFILES_SEARCH_ENDPOINT, **args)
+
+    def post_qualityprofiles_add_project(self, **args):
+        return self.post(BaseSonarQube.QUALITYPROFILES_ADD_PROJECT_ENDPOINT, **args)
+
+
+class SonarQube(BaseSonarQube):
+
+    """
+    Adapter for SonarQube's web service API.
+    """
+    # Rule keys looked up per /api/rules/search request
+    RULE_KEYS_BATCH_SIZE = 100
+    # Issues buffered while resolving their rules
+    ISSUES_ENRICH_BATCH_SIZE = 500
+    # Project keys per /api/measures/search request, the server's maximum
+    MEASURES_SEARCH_BATCH_SIZE = 100
+    # Disjoint values splitting an issues search, to count facets exactly
+    ISSUE_PARTITIONS = (
+        ('resolved', ('false', 'true')),
+        ('severities', ('INFO', 'MINOR', 'MAJOR', 'CRITICAL', 'BLOCKER')),
+        ('types', ('CODE_SMELL', 'BUG', 'VULNERABILITY')),
+    )
+    # Exports split issues created in the same second further, by the values of these facets
+    EXPORT_PARTITIONS = ISSUE_PARTITIONS + (('rules', None),)
+    # Values listed by an issues search facet; a facet listing as many may be truncated
+    ISSUE_FACET_LIMIT = 100
+    ISSUE_FACET_LIMITS = {'cwe': 15, 'owaspTop10': 15, 'owaspTop10-2021': 15, 'sansTop25': 15,
+                          'sonarsourceSecurity': 15}
+    # Background task statuses that won't change any more
+    CE_TASK_DONE = ('SUCCESS', 'FAILED', 'CANCELED')
+    # Bytes read at a time when streaming pages
+    STREAM_CHUNK_SIZE = 64 * 1024
+    # Connections kept open per host, unless pool_maxsize or page_workers ask for more
+    DEFAULT_POOL_MAXSIZE = 10
+
+    def __init__(self, url=None, host=None, port=None, user=None, password=None,
+                 base_path=None, token=None, page_workers=None, cache=None, streaming=False,
+                 json_decoder=None, retry=None, rate_limiter=None, limiter=None, pool_maxsize=None,
+                 pool_block=False, timeout=None, compress=True, keep_alive=True, thread_safe=False,
+                 coalesce=False, metrics=None):
+        """
+        Set connection info and session, including auth (if user+password
+        and/or auth token were provided).
+
+        :param page_workers: if set, paged_get fetches the remaining pages
+            concurrently with this many workers once the total is known
+        :param cache: a sonarqube.cache MemoryCache or DiskCache, used for
+            endpoints that declare a cache_ttl
+        :param streaming: if set, paged_get parses each page incrementally and
+            yields items as they arrive instead of decoding whole pages
+            (not combined with page_workers, which needs whole pages)
+        :param json_decoder: 'orjson', 'msgspec', 'json' or a function decoding
+            bytes; defaults to the fastest one installed
+        :param retry: a sonarqube.resilience RetryPolicy for idempotent requests
+        :param rate_limiter: a sonarqube.resilience RateLimiter capping requests per second
+        :param limiter: a sonarqube.resilience AdaptiveLimiter capping requests in
+            flight, shared by every thread using this instance
+        :param pool_maxsize: connections kept open per host; defaults to the larger
+            of DEFAULT_POOL_MAXSIZE and page_workers. Size it to the number of
+            threads sharing the instance, or connections beyond it are discarded
+        :param pool_block: if set, threads wait for a pooled connection instead
+            of opening (and then discarding) an extra one
+        :param timeout: seconds to wait for the server, or a (connect, read) tuple
+        :param compress: if set, ask for gzip or deflate encoded responses
+        :param keep_alive: if not set, close each connection after its request
+        :param thread_safe: if set, each thread gets its own session, all sharing
+            one connection pool, so one instance can back any number of worker threads.
+            The threads this instance starts itself always get their own session
+        :param coalesce: if set, a GET identical to one already in flight waits for
+            its result instead of being sent; counts are kept in `flights`. The
+            result is shared between the callers, who shouldn't modify it
+        :param metrics: a sonarqube.metrics Metrics recording per endpoint latency,
+            bytes, decode time, items per page, errors and retries
+        """
+        super().__init__(url, host, port, user, password, base_path, token)
+        self._page_workers = page_workers
+        self._streaming = streaming
+        self._loads = json_decoder if callable(json_decoder) else _json_decoder(json_decoder)
+        self.cache = cache
+        self._cache_scope = cache_scope(self._url, self._credentials())
+        self.flights = SingleFlight() if coalesce else None
+        self.metrics = metrics
+        self._retry = retry
+        self._rate_limiter = rate_limiter
+        self._limiter = limiter
+        self._rules = {}
+        self._timeout = timeout
+        self._headers = {
+            'Accept-Encoding': 'gzip, deflate' if compress else 'identity',
+            'Connection': 'keep-alive' if keep_alive else 'close',
+        }
+        self._adapter = HTTPAdapter(pool_maxsize=pool_maxsize or max(self.DEFAULT_POOL_MAXSIZE,
+                                                                     page_workers or 0),
+                                    pool_block=pool_block)
+        self._thread_safe = thread_safe
+        self._local = threading.local()
+        self._shared_session = self._new_session()
+        logger.info(f'SonarQube at [{self._url}]')
+
+    @property
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            if not self._thread_safe:
+                return self._shared_session
+            session = self._local.session = self._new_session()
+        return session
+
+    def thread_pool(self, max_workers):
+        """
+        Return a ThreadPoolExecutor for fanning requests out, each of whose
+        threads gets its own session sharing this instance's connection pool.
+        """
+        return ThreadPoolExecutor(max_workers=max_workers, initializer=self._start_worker)
+
+    def _start_worker(self):
+        self._local.session = self._new_session()
+
+    def _new_session(self):
+        session = requests.Session()
+        # every session shares the one adapter, and so its connection pool
+        session.mount('http://', self._adapter)
+        session.mount('https://', self._adapter)
+        session.headers.update(self._headers)
+        session.auth = self._credentials()
+        return session
+
+    def close(self):
+        """
+        Close the pooled connections.
+        """
+        self._adapter.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
     def post(self, endpoint, **data):
-        return self.call(self._session.post, endpoint, **data)
+        return self._invalidating(endpoint, self.call(self._session.post, endpoint, **data))
         
     def get(self, endpoint, **data):
+        if self.flights is not None:
+            return self.flights.do(cache_key(self._cache_scope, endpoint, data), lambda: self._get(endpoint, **data))
+        return self._get(endpoint, **data)
+
+    def _get(self, endpoint, **data):
+        if self.cache is not None and endpoint.cache_ttl:
+            return self._cached_get(endpoint, **data)
         return self.call(self._session.get, endpoint, **data)
         
     def delete(self, endpoint, **data):
-        return self.call(self._session.delete, endpoint, **data)
+        return self._invalidating(endpoint, self.call(self._session.delete, endpoint, **data))
         
     def call(self, method, endpoint, **data):
-
-        res = method(self.endpoint_url(endpoint), stream=True, params=data or {})
+        res = self._request(method, endpoint, **data)
+        try:
+            return endpoint.item(self._decode(endpoint, res))
+        finally:
+            self._release(res)
+
+    def _request(self, method, endpoint, headers=None, **data):
+
+        attempt = 0
+        while True:
+            try:
+                res = self._send(method, endpoint, headers, data)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if not (self._retry and self._retry.should_retry(method.__name__.upper(), attempt)):
+                    if self.metrics is not None:
+                        self.metrics.error(endpoint.path)
+                    raise
+                delay = self._retry.delay(attempt)
+                logger.warning(f'[{endpoint.path}] {e}, retrying in {delay:.1f}s')
+            else:
+                if not (self._retry and self._retry.should_retry(method.__name__.upper(), attempt, res.status_code)):
+                    break
+                delay = self._retry.delay(attempt, res)
+                logger.warning(f'[{endpoint.path}] returned {res.status_code}, retrying in {delay:.1f}s')
+                self._release(res)
+                res.close()
+            if self.metrics is not None:
+                self.metrics.retry(endpoint.path)
+            time.sleep(delay)
+            attempt += 1
 
         # Analyse response status and return or raise exception
         # Note: redirects are followed automatically by requests
-        raise_for_status(res)
-        
-        # OK, return http response
+        if self.metrics is not None and res.status_code >= 400:
+            self.metrics.error(endpoint.path)
+        try:
+            raise_for_status(res)
+        except Exception:
+            self._release(res)
+            raise
+        return res
+
+    def _send(self, method, endpoint, headers, data):
+        if self._rate_limiter:
+            self._rate_limiter.acquire()
+        if not self._limiter:
+            return self._http(method, endpoint, headers, data)
+        window = self._limiter.acquire()
+        try:
+            res = self._http(method, endpoint, headers, data)
+        except Exception as e:
+            # a server we can't connect to, or that doesn't answer in time, is congested too
+            self._limiter.release(isinstance(e, (requests.ConnectionError, requests.Timeout)), window)
+            raise
+        res.limiter_window = window
+        return res
+
+    def _release(self, res):
+        # bodies are read lazily, the request is in flight until its body has been read.
+        # Any status worth retrying means the server is struggling
+        if self._limiter:
+            congested = res.status_code in RetryPolicy.THROTTLED or \
+                (self._retry is not None and res.status_code in self._retry.statuses)
+            self._limiter.release(congested, res.limiter_window)
+
+    def _http(self, method, endpoint, headers, data):
+        start = time.perf_counter() if self.metrics is not None else None
+        try:
+            return method(self.endpoint_url(endpoint), stream=True, params=data or {}, headers=headers,
+                          timeout=self._timeout)
+        finally:
+            if start is not None:
+                self.metrics.request(endpoint.path, time.perf_counter() - start)
+
+    def _decode(self, endpoint, res):
+        # OK, return http response, decoded straight from the bytes
+        start = time.perf_counter() if self.metrics is not None else None
         json = None
-        if (res.text):
-            json = res.json()
-            if endpoint.response_item:
-                for item in endpoint.response_item.split('.'):
-                    if item in json:
-                        json = json[item]
-                    else:
-                        json = None
-                        break
+        content = res.content
+        if (content):
+            json = self._loads(content)
+        if start is not None:
+            self.metrics.decode(endpoint.path, len(content or b''), time.perf_counter() - start)
         return json
 
+    def _cached_get(self, endpoint, **data):
+        key = cache_key(self._cache_scope, endpoint, data)
+        entry = self.cache.get(key)
+        if entry is not None and entry.fresh():
+            self.cache.stats.count('hits')
+            return endpoint.item(entry.value)
+
+        revalidating = entry is not None and entry.revalidatable()
+        res = self._request(self._session.get, endpoint,
+                            headers=entry.validators() if revalidating else None, **data)
+        try:
+            if revalidating and res.status_code == 304:
+                self.cache.stats.count('revalidations')
+            else:
+                self.cache.stats.count('misses')
+                entry = CacheEntry(self._decode(endpoint, res), None,
+                                   res.headers.get('ETag'), res.headers.get('Last-Modified'))
+        finally:
+            self._release(res)
+        entry.expires = time.time() + endpoint.cache_ttl
+        self.cache.set(key, entry)
+        return endpoint.item(entry.value)
+
+    def _invalidating(self, endpoint, result):
+        if self.cache is not None:
+            for invalidated in endpoint.invalidates:
+                self.cache.invalidate(f'{self._cache_scope}{invalidated.path}')
+                self.cache.stats.count('invalidations')
+        return result
+
     def paged_get(self, endpoint, **data):
+        if self._page_workers:
+            return self._prefetch_paged_get(endpoint, **data)
+        return self._serial_paged_get(endpoint, **data)
+
+    def _serial_paged_get(self, endpoint, **data):
 
         qs = data.copy()
         pager = endpoint.pager
@@ -167,48 +514,390 @@ class SonarQube:
 
         # Cycle through rules
         while pager.has_next_page(res):
-            res = self.get(endpoint, **qs)
+            first_page = res is None
+            if self._streaming:
+                # Yield items while the page is parsed, paging info is known at the end
+                page = self._stream_page(endpoint, **qs)
+                count = 0
+                for item in page:
+                    count += 1
+                    yield item
+                res = page.fields
+                if self.metrics is not None:
+                    self.metrics.page(endpoint.path, count)
+            else:
+                res = self.get(endpoint, **qs)
+                for item in self._page_items(endpoint, res):
+                    yield item
+            if first_page:
+                self._warn_if_truncated(endpoint, res)
 
             pager.next_page_number(res, qs)
 
-            # Yield items
-            for item in pager.items(res):
-                # print(item)
-                yield item
+    def _stream_page(self, endpoint, **data):
+        res = self._request(self._session.get, endpoint, **data)
+        # items are handed out while the body is read, and the consumer may send other requests
+        # meanwhile: holding on to the limit until the page is exhausted could deadlock
+        self._release(res)
+        return StreamedPage(_iter_content(res, SonarQube.STREAM_CHUNK_SIZE), endpoint.pager.response_items)
 
-    def get_authentication_validate(self):
-        return self.get(SonarQube.AUTH_VALIDATION_ENDPOINT)
+    def _prefetch_paged_get(self, endpoint, **data):
 
-    def post_projects_create(self, **args):
-        return self.post(SonarQube.PROJECTS_CREATE_ENDPOINT, **args)
+        qs = data.copy()
+        pager = endpoint.pager
+        qs.setdefault(pager.request_page_size, pager.max_page_size)
+
+        # First page tells us how many pages there are
+        res = self.get(endpoint, **qs)
+        self._warn_if_truncated(endpoint, res)
+        for item in self._page_items(endpoint, res):
+            yield item
+
+        first = pager.page_index(res) + 1
+        last = pager.last_page(res)
+        if first > last:
+            return
+
+        def fetch(page):
+            return self.get(endpoint, **dict(qs, **{pager.request_page_number: page}))
+
+        # Keep a couple of pages per worker queued ahead of the consumer
+        window = 2 * self._page_workers
+        with self.thread_pool(self._page_workers) as executor:
+            for res in bounded_map(executor, fetch, range(first, last + 1), window):
+                for item in self._page_items(endpoint, res):
+                    yield item
+
+    def _page_items(self, endpoint, res):
+        items = endpoint.pager.items(res)
+        if self.metrics is not None:
+            self.metrics.page(endpoint.path, len(items))
+        return items
+
+    def get_issues(self, with_rules=False, **args):
+        """
+        :param with_rules: attach each issue's rule as 'ruleDetails', see enrich_issues
+        """
+        issues = super().get_issues(**args)
+        return self.enrich_issues(issues) if with_rules else issues
 
-    def post_projects_delete(self, **args):
-        return self.post(SonarQube.PROJECTS_DELETE_ENDPOINT, **args)
-    
-    def get_projects_search(self, **args):
-        return self.paged_get(SonarQube.PROJECTS_ENDPOINT, **args)
+    def resolve_rules(self, keys):
+        """
+        Return a dict of rule key to rule for the given keys. Rules not seen
+        before are looked up in bulk through /api/rules/search, external
+        analyzers' rules included, and memoized; so are keys the server
+        doesn't know, which are left out.
+        """
+        keys = set(keys)
+        missing = sorted(key for key in keys if key not in self._rules)
+        batch_size = SonarQube.RULE_KEYS_BATCH_SIZE
+        for i in range(0, len(missing), batch_size):
+            batch = missing[i:i + batch_size]
+            for rule in self.get_rules_search(rule_keys=','.join(batch), include_external='true'):
+                self._rules[rule['key']] = rule
+            for key in batch:
+                self._rules.setdefault(key, None)
+        return {key: self._rules[key] for key in keys if self._rules.get(key) is not None}
+
+    def enrich_issues(self, issues):
+        """
+        Yield the issues with their rule attached as 'ruleDetails',
+        resolving the rules of each batch of issues in one go.
+        """
+        batch = []
+        for issue in issues:
+            batch.append(issue)
+            if len(batch) >= SonarQube.ISSUES_ENRICH_BATCH_SIZE:
+                yield from self._attach_rules(batch)
+                batch = []
+        yield from self._attach_rules(batch)
+
+    def _attach_rules(self, issues):
+        rules = self.resolve_rules(issue['rule'] for issue in issues)
+        for issue in issues:
+            issue['ruleDetails'] = rules.get(issue['rule'])
+        return issues
+
+    def export_issues(self, workers=4, **args):
+        """
+        Yield every issue matching args, including past the result cap of
+        /api/issues/search. The query is split into disjoint creation date
+        windows, each small enough to page through, which are fetched
+        concurrently and merged into one stream without duplicates.
+
+        :param workers: number of windows fetched in parallel
+        :raises ValueError: for createdInLast, which can't be combined with the
+            windows; pass createdAfter instead
+        """
+        if 'createdInLast' in args:
+            raise ValueError('export_issues splits the query on creation dates, use createdAfter '
+                             'rather than createdInLast')
+        pager = SonarQube.ISSUES_ENDPOINT.pager
+        args.setdefault(pager.request_page_size, pager.max_page_size)
+        seen = set()
+        with self.thread_pool(workers) as executor:
+            slices = self._issue_slices(executor, **args)
+            fetch = lambda qs: list(self._serial_paged_get(SonarQube.ISSUES_ENDPOINT, **qs))
+            for issues in bounded_map(executor, fetch, slices, workers):
+                for issue in issues:
+                    if issue['key'] not in seen:
+                        seen.add(issue['key'])
+                        yield issue
+
+    def _issue_count(self, args):
+        res = self.get(SonarQube.ISSUES_ENDPOINT, **dict(args, p=1, ps=1))
+        return SonarQube.ISSUES_ENDPOINT.pager.total(res)
+
+    def _issue_slices(self, executor, **args):
+        cap = SonarQube.ISSUES_ENDPOINT.pager.max_results
+        count = self._issue_count(args)
+        if count <= cap:
+            return [args]
+        if 'createdAt' in args:
+            # a single creation date, there is no window to split
+            return self._issue_partitions(executor, args, count, SonarQube.EXPORT_PARTITIONS)
+
+        # Bisect [start, end) until every window is under the cap,
+        # counting each level's windows in parallel
+        slices = []
+        windows = [self._issue_date_range(args)]
+        while windows:
+            queries = [dict(args, createdAfter=format_date(a), createdBefore=format_date(b))
+                       for a, b in windows]
+            split = []
+            for (a, b), qs, count in zip(windows, queries, executor.map(self._issue_count, queries)):
+                if not count:
+                    continue
+                if count <= cap:
+                    slices.append((a, [qs]))
+                elif b - a <= timedelta(seconds=1):
+                    # e.g. a first analysis without SCM dates, where every issue gets the analysis date
+                    slices.append((a, self._issue_partitions(executor, qs, count, SonarQube.EXPORT_PARTITIONS)))
+                else:
+                    split += _bisect(a, b)
+            windows = split
+        slices = [qs for _, partition in sorted(slices, key=lambda s: s[0]) for qs in partition]
+        logger.info(f'Exporting issues in {len(slices)} slices')
+        return slices
+
+    def _issue_partitions(self, executor, args, count, partitions):
+        # Split a query over the cap into disjoint queries on the values of each partition in turn
+        cap = SonarQube.ISSUES_ENDPOINT.pager.max_results
+        for i, (param, values) in enumerate(partitions):
+            if param in args:
+                continue
+            if values is None:
+                _, facet = self._issue_facet(param, args)
+                if not facet or self._facet_truncated(param, facet):
+                    continue
+                values = list(facet)
+            queries = [dict(args, **{param: value}) for value in values]
+            slices = []
+            for qs, count in zip(queries, executor.map(self._issue_count, queries)):
+                if count > cap:
+                    slices += self._issue_partitions(executor, qs, count, partitions[i + 1:])
+                elif count:
+                    slices.append(qs)
+            return slices
+        logger.warning(f'{count} issues matching {args} can\'t be split further, only the first {cap} can be exported')
+        return [args]
+
+    def _issue_date_range(self, args):
+        # Creation date window [start, end) covering the issues matching args
+        if 'createdAfter' in args:
+            start = parse_date(args['createdAfter'])
+        else:
+            oldest = self.get(SonarQube.ISSUES_ENDPOINT, **dict(args, s='CREATION_DATE', asc='true', ps=1))
+            start = parse_date(oldest['issues'][0]['creationDate'])
+        if 'createdBefore' in args:
+            end = parse_date(args['createdBefore'])
+        else:
+            end = datetime.now(timezone.utc).replace(microsecond=0) + timedelta(seconds=1)
+        return start, end
 
-    def get_issues(self, **args):
-        return self.paged_get(SonarQube.ISSUES_ENDPOINT, **args)
+    def issue_counts(self, group_by, workers=4, **filters):
+        """
+        Return a Counter of the issues matching filters per value of a facet,
+        e.g. issue_counts('severities', projects='my-project'), counted by
+        the server rather than by downloading the issues.
+
+        When the facet lists as many values as it can, and so may be
+        truncated, the query is split into disjoint partitions (resolution,
+        severity, type, then creation date) whose counts are added up. Issues
+        without a value, e.g. untagged ones, aren't counted; for multi valued
+        fields such as tags or cwe an issue is counted once per value, so the
+        counts can add up to more than the number of issues.
+
+        :param group_by: issues search facet
+        :param workers: number of facet queries sent in parallel
+        """
+        counts = Counter()
+        # (query, partitions still available, creation date window or None)
+        queries = [(filters, SonarQube.ISSUE_PARTITIONS, None)]
+        with self.thread_pool(workers) as executor:
+            while queries:
+                facets = executor.map(lambda q: self._issue_facet(group_by, q[0]), queries)
+                split = []
+                for (qs, partitions, window), (_, values) in zip(queries, facets):
+                    if not self._facet_truncated(group_by, values):
+                        counts.update(values)
+                    else:
+                        split += self._split_issue_query(qs, partitions, window, group_by)
+                queries = split
+        return counts
+
+    def _issue_facet(self, group_by, args):
+        res = self.get(SonarQube.ISSUES_ENDPOINT, **dict(args, p=1, ps=1, facets=group_by))
+        facet = next((f['values'] for f in res.get('facets', []) if f['property'] == group_by), [])
+        return SonarQube.ISSUES_ENDPOINT.pager.total(res), Counter({v['val']: v['count'] for v in facet})
+
+    def _facet_truncated(self, group_by, values):
+        return len(values) >= SonarQube.ISSUE_FACET_LIMITS.get(group_by, SonarQube.ISSUE_FACET_LIMIT)
+
+    def _split_issue_query(self, qs, partitions, window, group_by):
+        for i, (param, param_values) in enumerate(partitions):
+            if param != group_by and param not in qs:
+                return [(dict(qs, **{param: value}), partitions[i + 1:], None) for value in param_values]
+
+        a, b = window or self._issue_date_range(qs)
+        if b - a <= timedelta(seconds=1):
+            logger.warning(f'Issue counts by [{group_by}] for issues created at [{format_date(a)}] are incomplete')
+            return []
+        return [(dict(qs, createdAfter=format_date(a), createdBefore=format_date(b)), (), (a, b))
+                for a, b in _bisect(a, b)]
+
+    def portfolio_measures(self, metric_keys, workers=4, **args):
+        """
+        Return a MeasureMatrix of metric_keys for every project matching args
+        (as for get_projects_search), fetched through /api/measures/search
+        for batches of projects at a time, concurrently.
 
-    def get_measures(self, **args):
-        return self.get(SonarQube.MEASURES_ENDPOINT, **args)
+        :param metric_keys: list of metric keys, e.g. ['ncloc', 'coverage']
+        :param workers: number of batches fetched in parallel
+        """
+        # table pulls in numpy when installed, only import it when needed
+        from .table import MeasureMatrix
+        matrix = MeasureMatrix(metric_keys)
+        metrics = ','.join(metric_keys)
+        projects = (project['key'] for project in self.get_projects_search(**args))
+
+        def fetch(keys):
+            return keys, self.get_measures_search(projectKeys=','.join(keys), metricKeys=metrics)
+
+        with self.thread_pool(workers) as executor:
+            batches = chunked(projects, SonarQube.MEASURES_SEARCH_BATCH_SIZE)
+            for keys, measures in bounded_map(executor, fetch, batches, workers):
+                matrix.add(keys, measures or [])
+        return matrix
+
+    def measures_history(self, project_keys, metric_keys, workers=4, previous=None):
+        """
+        Return a dict of project key to MeasureHistory of metric_keys,
+        loading the projects concurrently.
 
-    def get_rule(self, **args):
-        return self.get(SonarQube.RULE_ENDPOINT, **args)
+        :param previous: dict of project key to MeasureHistory from an earlier
+            call, which are extended in place with the analyses since their
+            last date rather than downloaded again
+        """
+        from .table import MeasureHistory
+        previous = previous or {}
+        metrics = ','.join(metric_keys)
+        page_size = SonarQube.MEASURES_HISTORY_ENDPOINT.pager.max_page_size
+
+        def fetch(key):
+            history = previous.get(key) or MeasureHistory(key, metric_keys)
+            args = {'component': key, 'metrics': metrics, 'ps': page_size}
+            if len(history):
+                args['from'] = history.last_date()
+            history.add(self.get_measures_search_history(**args))
+            return key, history
+
+        with self.thread_pool(workers) as executor:
+            return dict(executor.map(fetch, project_keys))
+
+    def gate_statuses(self, project_keys, workers=8):
+        """
+        Return a dict of project key to quality gate project status,
+        querying the projects concurrently.
+        """
+        def fetch(key):
+            return key, self.get_qualitygates_project_status(projectKey=key)
 
-    def post_qualitygates_select(self, **args):
-        return self.post(SonarQube.QUALITYGATES_SELECT_ENDPOINT, **args)
+        with self.thread_pool(workers) as executor:
+            return dict(executor.map(fetch, project_keys))
 
-    def get_qualitygates_project_status(self, **args):
-        return self.get(SonarQube.QUALITYGATES_PROJECT_STATUS_ENDPOINT, **args)
+    def wait_for_gate(self, task_id=None, project_key=None, **args):
+        """
+        Wait for an analysis to be processed and return its quality gate
+        project status, None if its background task failed.
 
-    def get_qualitygates_get_by_project(self, **args):
-        return self.get(SonarQube.QUALITYGATES_GET_BY_PROJECT_ENDPOINT, **args)
+        :param task_id: background task id, as written by the scanner to report-task.txt
+        :param project_key: alternatively, wait for the project's latest submitted task
+        :param args: as for wait_for_gates
+        """
+        if task_id is None:
+            task_id = self._latest_task(project_key)
+        _, status = next(self.wait_for_gates([task_id], **args))
+        return status
 
-    def get_qualityprofiles_search(self, **args):
-        return self.get(SonarQube.QUALITYPROFILES_SEARCH_ENDPOINT, **args)
+    def wait_for_gates(self, task_ids, timeout=600, workers=8, initial_delay=1, max_delay=30):
+        """
+        Poll background analysis tasks and yield (task, project status) as
+        soon as each one finishes; project status is None if the task failed.
+        Each task is polled with its own exponential backoff with jitter.
+
+        :raises TimeoutError: if tasks are still pending after timeout seconds
+        """
+        deadline = time.monotonic() + timeout
+        # (next poll time, task id, current delay)
+        pending = [(time.monotonic(), task_id, initial_delay) for task_id in task_ids]
+        heapq.heapify(pending)
+
+        def poll(task_id):
+            task = self.get_ce_task(id=task_id)
+            status = None
+            if task['status'] == 'SUCCESS' and task.get('analysisId'):
+                status = self.get_qualitygates_project_status(analysisId=task['analysisId'])
+            return task, status
+
+        with self.thread_pool(workers) as executor:
+            while pending:
+                now = time.monotonic()
+                if pending[0][0] > now:
+                    if pending[0][0] > deadline:
+                        raise TimeoutError(f'Tasks still pending after {timeout}s: {[p[1] for p in pending]}')
+                    time.sleep(pending[0][0] - now)
+                    continue
+
+                due = []
+                while pending and pending[0][0] <= now:
+                    due.append(heapq.heappop(pending))
+                for (_, task_id, delay), (task, status) in zip(due, executor.map(lambda d: poll(d[1]), due)):
+                    if task['status'] in SonarQube.CE_TASK_DONE:
+                        logger.info(f'Task [{task_id}] of [{task.get("componentKey")}] {task["status"]}')
+                        yield task, status
+                    else:
+                        wait = delay * random.uniform(0.5, 1.0)
+                        heapq.heappush(pending, (time.monotonic() + wait, task_id, min(delay * 2, max_delay)))
+
+    def _latest_task(self, project_key):
+        res = self.get_ce_component(component=project_key)
+        tasks = res.get('queue') or ([res['current']] if res.get('current') else [])
+        if not tasks:
+            raise ValueError(f'No analysis submitted for [{project_key}]')
+        return max(tasks, key=lambda task: task['submittedAt'])['id']
+
+
+def _iter_content(res, chunk_size):
+    # release the connection even if the page isn't read to the end
+    try:
+        for chunk in res.iter_content(chunk_size):
+            yield chunk
+    finally:
+        res.close()
+
+
+def _bisect(start, end):
+    middle = (start + (end - start) / 2).replace(microsecond=0)
+    return [(start, middle), (middle, end)]
 
-    def post_qualityprofiles_add_project(self, **args):
-        return self.post(SonarQube.QUALITYPROFILES_ADD_PROJECT_ENDPOINT, **args)
-    
\ No newline at end of file
@@ -0,0 +1,236 @@
+"""
+This module contains response caches for the read endpoints of the SonarQube
+adapter.
+
+An endpoint is cached when it declares a cache_ttl and the adapter was given
+a cache. Expired entries that carried an ETag or Last-Modified header are
+revalidated with a conditional request rather than fetched again. Keys are
+scoped to the server and the credentials used, so one cache can be shared
+by clients of different servers or users.
+
+Identical GETs made concurrently can also be coalesced with a SingleFlight,
+cached or not.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+
+def cache_scope(url, credentials):
+    # the server, and who is asking, without keeping the secret itself
+    identity = hashlib.sha256('\0'.join(credentials).encode('utf-8')).hexdigest()[:16] if credentials else 'anonymous'
+    return f'{identity}@{url}'
+
+
+def cache_key(scope, endpoint, data):
+    return f'{scope}{endpoint.path}?{urlencode(sorted(data.items()), doseq=True)}'
+
+
+class CacheEntry:
+
+    __slots__ = ('value', 'expires', 'etag', 'last_modified')
+
+    def __init__(self, value, expires, etag=None, last_modified=None):
+        self.value = value
+        self.expires = expires
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def fresh(self):
+        return time.time() < self.expires
+
+    def revalidatable(self):
+        return bool(self.etag or self.last_modified)
+
+    def validators(self):
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class CacheStats:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.invalidations = 0
+
+    def count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in ('hits', 'misses', 'revalidations', 'invalidations')}
+
+    def __repr__(self):
+        return f'CacheStats({self.as_dict()})'
+
+
+class MemoryCache:
+
+    """
+    Thread safe in-process cache, evicting the least recently used entry
+    once it holds maxsize entries.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.stats = CacheStats()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, path):
+        # path is the scoped endpoint path, what keys hold before their '?'
+        prefix = f'{path}?'
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class DiskCache:
+
+    """
+    SQLite backed cache that can be shared by several processes,
+    evicting the least recently used entries past maxsize.
+    """
+
+    # Seconds an entry's last access time may lag behind, so that reads rarely write
+    ACCESS_RESOLUTION = 60
+    # Share of maxsize evicted at once, so that writes rarely evict
+    EVICT_FRACTION = 0.1
+
+    def __init__(self, filename, maxsize=100000):
+        self.filename = filename
+        self.maxsize = maxsize
+        self.stats = CacheStats()
+        self._local = threading.local()
+        with self._connection() as db:
+            db.execute('CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, path TEXT, value TEXT, '
+                       'expires REAL, etag TEXT, last_modified TEXT, accessed REAL)')
+            db.execute('CREATE INDEX IF NOT EXISTS entries_path ON entries (path)')
+            db.execute('CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)')
+
+    def _connection(self):
+        # sqlite connections can't be shared between threads
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.filename, timeout=30)
+            db.execute('PRAGMA journal_mode=WAL')
+        return db
+
+    def get(self, key):
+        with self._connection() as db:
+            row = db.execute('SELECT value, expires, etag, last_modified, accessed FROM entries WHERE key = ?',
+                             (key,)).fetchone()
+            if row is None:
+                return None
+            value, expires, etag, last_modified, accessed = row
+            now = time.time()
+            if now - accessed > DiskCache.ACCESS_RESOLUTION:
+                db.execute('UPDATE entries SET accessed = ? WHERE key = ?', (now, key))
+        return CacheEntry(json.loads(value), expires, etag, last_modified)
+
+    def set(self, key, entry):
+        with self._connection() as db:
+            db.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)',
+                       (key, key.split('?', 1)[0], json.dumps(entry.value), entry.expires,
+                        entry.etag, entry.last_modified, time.time()))
+            count = db.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+            if count > self.maxsize:
+                # down to below maxsize, oldest first through the accessed index
+                evicted = count - self.maxsize + int(self.maxsize * DiskCache.EVICT_FRACTION)
+                db.execute('DELETE FROM entries WHERE key IN (SELECT key FROM entries '
+                           'ORDER BY accessed LIMIT ?)', (evicted,))
+
+    def invalidate(self, path):
+        with self._connection() as db:
+            db.execute('DELETE FROM entries WHERE path = ?', (path,))
+
+    def clear(self):
+        with self._connection() as db:
+            db.execute('DELETE FROM entries')
+
+
+class SingleFlight:
+
+    """
+    Coalesces identical concurrent calls: while a call for a key is in flight,
+    further calls for that key wait for its result, or exception, instead of
+    making their own. Every caller gets the same result object.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.calls = 0
+        self.saved = 0
+
+    def do(self, key, call):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.calls += 1
+            else:
+                self.saved += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = call()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def as_dict(self):
+        return {'calls': self.calls, 'saved': self.saved}
+
+    def __repr__(self):
+        return f'SingleFlight({self.as_dict()})'
+
+
+class _Flight:
+
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
@@ -1,16 +1,72 @@
 import click
 import logging
-from requests import RequestException
+import shlex
 from os import path
-import yaml
-from .api import SonarQube
-from .community import Project
-from .exceptions import CliException
+
+# Heavier modules (requests, yaml and the API itself) are imported on first use,
+# so --help and argument errors return straight away
 
 # logging
 logger = logging.getLogger()
 
-pass_config = click.make_pass_decorator(Project, ensure=True)
+
+class Client(object):
+    """
+    Connection options, and the SonarQube client built from them when first
+    used, shared by every command run in the process, as is the project
+    index when enabled.
+    """
+    def __init__(self, parallel=1, index=False, **options):
+        self.parallel = parallel
+        self.options = options
+        self.use_index = index
+        self._index = None
+        self._sq = None
+
+    @property
+    def sq(self):
+        if self._sq is None:
+            from .api import SonarQube
+            from .community import Project
+            # shared by every worker, each project using up to MAX_WORKERS connections
+            self._sq = SonarQube(thread_safe=True, pool_maxsize=max(1, self.parallel) * Project.MAX_WORKERS,
+                                 **self.options)
+        return self._sq
+
+    @property
+    def index(self):
+        if (self.use_index and self._index is None):
+            from .community import ProjectIndex
+            self._index = ProjectIndex(self.sq)
+        return self._index
+
+
+class Manifest(object):
+    """
+    The projects of a config file, read when first needed, and how many to
+    process at once.
+    """
+    def __init__(self, projects=None, parallel=1, config=None, suffix=None, client=None):
+        self._projects = projects
+        self.parallel = parallel
+        self.config = config
+        self.suffix = suffix
+        self.client = client
+
+    @property
+    def projects(self):
+        if self._projects is None:
+            self._projects = _read_projects(file=self.config, suffix=self.suffix, sq=self.client.sq,
+                                            index=self.client.index) if self.client else []
+        return self._projects
+
+    def load(self, config=None, suffix=None):
+        # Another config file, over the same client
+        return Manifest(parallel=self.parallel, config=config or self.config, suffix=suffix or self.suffix,
+                        client=self.client)
+
+
+pass_config = click.make_pass_decorator(Manifest, ensure=True)
 
 @click.group()
 @click.option('-c', 'config', help='Configuration file')
@@ -20,56 +76,140 @@ pass_config = click.make_pass_decorator(Project, ensure=True)
 @click.option('-p', 'port', help='SonarQube port')
 @click.option('-t', 'token', help='SonarQube personal access token')
 @click.option('-l', 'log_level', help='Logging level')
+@click.option('-j', 'parallel', type=int, default=4, help='Number of projects to process at once')
+@click.option('--profile', is_flag=True, help='Print request metrics per endpoint at exit')
+@click.option('--index', is_flag=True, help='List every project once to resolve many projects, instead of a search each')
 @click.pass_context
-def cli(ctx, config=None, suffix=None, url=None, host=None, port=None, token=None, log_level=None):
+def cli(ctx, config=None, suffix=None, url=None, host=None, port=None, token=None, log_level=None, parallel=4,
+        profile=False, index=False):
     logging.basicConfig(level=log_level or logging.INFO)
-    sq = SonarQube(url=url, host=host, port=port, token=token)
-    ctx.obj = _read_project(file=config, suffix=suffix, sq = sq)
+    metrics = None
+    if profile:
+        from .metrics import Metrics
+        metrics = Metrics()
+        ctx.call_on_close(lambda: click.echo(metrics.summary(), err=True))
+    client = Client(parallel, index, url=url, host=host, port=port, token=token, metrics=metrics)
+    ctx.obj = Manifest(parallel=parallel, config=config, suffix=suffix, client=client)
 
 @cli.command()
 @pass_config
-def create(project):
-    try:
-        project.create_or_update()
-    except RequestException as e:
-        handleRequestException('create', e)
+def create(manifest):
+    _run_all('create', manifest, lambda project: project.create_or_update())
 
 @cli.command()
 @pass_config
-def delete(project):
-    try:
-        project.delete()
-    except RequestException as e:
-        handleRequestException('delete', e)
+def delete(manifest):
+    _run_all('delete', manifest, lambda project: project.delete())
 
-def handleRequestException(command, e):
+@cli.command()
+@click.option('-k', '--keep', multiple=True, help='Branch whose project is kept, may be repeated')
+@click.option('--analyzed-before', help='Only prune projects last analyzed before this date (yyyy-MM-dd)')
+@click.option('--dry-run', is_flag=True, help='List the projects that would be deleted')
+@pass_config
+def prune(manifest, keep=None, analyzed_before=None, dry_run=False):
+    def prune_project(project):
+        for key in project.prune(keep=keep, analyzed_before=analyzed_before, dry_run=dry_run):
+            click.echo(key)
+    _run_all('prune', manifest, prune_project)
+
+@cli.command()
+@click.argument('operations', type=click.File('r'), default='-')
+@click.pass_context
+def batch(ctx, operations):
+    """
+    Run the create, delete and prune operations listed in OPERATIONS (stdin
+    by default) over one client, one per line, with their -c and -s args
+    before the command as on the command line, e.g.
+
+    \b
+        -c app.yml -s feature/x create
+        -c app.yml prune -k main --dry-run
+
+    Every line is run, the exit code is the highest of their error codes.
+    """
+    from .exceptions import CliException
+    manifest = ctx.find_object(Manifest)
+    codes = [0]
+    for number, line in enumerate(operations, 1):
+        args = shlex.split(line, comments=True)
+        if (not args):
+            continue
+        try:
+            codes.append(operation.main(args, prog_name=f'line {number}:', standalone_mode=False, obj=manifest) or 0)
+        except click.ClickException as e:
+            e.show()
+            codes.append(e.exit_code)
+        except CliException as e:
+            logger.error(f"Error on line { number }: { e }")
+            codes.append(1)
+    if (max(codes)):
+        raise click.exceptions.Exit(max(codes))
+
+@click.group()
+@click.option('-c', 'config', help='Configuration file')
+@click.option('-s', 'suffix', help='Suffix to use when managing SonarQube projects')
+@click.pass_context
+def operation(ctx, config=None, suffix=None):
+    # A line of a batch: the config it names, over the batch's client
+    ctx.obj = ctx.obj.load(config, suffix)
+
+for command in (create, delete, prune):
+    operation.add_command(command)
+
+def _run_all(command, manifest, action):
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    from requests import RequestException
+    # Every project is attempted, failures are reported together
+    errors = {}
+    with ThreadPoolExecutor(max_workers=max(1, manifest.parallel)) as executor:
+        futures = {executor.submit(action, project): project for project in manifest.projects}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except RequestException as e:
+                errors[futures[future].full_key] = e
+    if (errors):
+        err_codes = [errorCode(command, e, key) for key, e in errors.items()]
+        logger.error(f"Error on '{ command }' for { len(errors) } of { len(manifest.projects) } projects")
+        raise click.exceptions.Exit(max(err_codes))
+
+def errorCode(command, e, project=None):
     err_code = 1
+    on = f"'{ command }'" + (f" of [{ project }]" if project else '')
     if (e.response is not None):
         status_code = e.response.status_code
-        logger.info(f"Error on '{ command }' with response: { vars(e.response) }")
+        logger.info(f"Error on { on } with response: { vars(e.response) }")
         err_code = int(str(status_code)[:1])
-    logger.error(f"Error on 'create' returning error code [{ err_code }]")
-    raise click.exceptions.Exit(err_code)
+    logger.error(f"Error on { on } returning error code [{ err_code }]")
+    return err_code
     
     
-def _read_project(file = None, suffix = None, sq = None):
+def _read_projects(file = None, suffix = None, sq = None, index = None):
+    import yaml
+    from .exceptions import CliException
     config_filename = file or ".sonarqube.yml"
     if (not path.isfile(config_filename)):
         raise CliException(f"Sonarqube config file missing: [{config_filename}]")
     with open(config_filename, "r") as stream:
         try:
             config = yaml.safe_load(stream)
-            config_project = config['project']
-            return Project(
-                key = config_project['key'],
-                name = config_project['name'],
-                suffix = suffix,
-                quality_gate = config_project['quality-gate'],
-                quality_profiles = config_project['quality-profiles'] or {},
-                sq = sq
-            )
         except yaml.YAMLError as exc:
-            raise CliException("Failed to parse config file [%s] %s".format(config_filename, exc))
+            raise CliException(f"Failed to parse config file [{config_filename}] {exc}")
+    # a single 'project' or a list of 'projects'
+    config_projects = config['projects'] if 'projects' in config else [config['project']]
+    return [_to_project(config_project, suffix, sq, index) for config_project in config_projects]
+
+def _to_project(config_project, suffix = None, sq = None, index = None):
+    from .community import Project
+    return Project(
+        key = config_project['key'],
+        name = config_project['name'],
+        suffix = config_project.get('suffix', suffix),
+        quality_gate = config_project.get('quality-gate'),
+        quality_profiles = config_project.get('quality-profiles') or {},
+        sq = sq,
+        index = index
+    )
 
 if __name__ == "__main__":
     cli()
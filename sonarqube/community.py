@@ -11,7 +11,9 @@ Given we may need to create multiple projects, one per branch, using the UI to a
 can be tedious. This module simplifies this by assigning the gate at project creation.
 """
 from .api import SonarQube
+from bisect import bisect_left, insort
 import logging
+import threading
 
 logger = logging.getLogger('sonarqube.community')
        
@@ -19,46 +21,112 @@ class Project(object):
     
     DEFAULT_KEY_DELIMITER = ':'
     DEFAULT_NAME_DELIMITER = ' '
+    # Reads and writes sent concurrently by create_or_update
+    MAX_WORKERS = 4
+    # Project keys per bulk delete request
+    BULK_DELETE_BATCH_SIZE = 50
     
     def __init__(self, key, name, suffix=None, quality_gate=None, quality_profiles=None,
-                 key_delimiter=None, name_delimiter=None, sq=None) -> None:
+                 key_delimiter=None, name_delimiter=None, sq=None, index=None) -> None:
         super().__init__()
         self.key = key
         self.name = name
         self.suffix = self.sanitise(suffix)
         self.quality_gate = quality_gate
         self.quality_profiles = quality_profiles
-        self.full_key = self.format(self.key, key_delimiter or Project.DEFAULT_KEY_DELIMITER, self.suffix)
+        self.key_delimiter = key_delimiter or Project.DEFAULT_KEY_DELIMITER
+        self.full_key = self.format(self.key, self.key_delimiter, self.suffix)
         self.full_name = self.format(self.name, name_delimiter or Project.DEFAULT_NAME_DELIMITER, self.suffix)
         self.sq = sq or SonarQube()
+        self.index = index
         self.sq_project = None
         self.sq_quality_profiles = None
     
     def read(self):
-        self.sq_project = next(self.sq.get_projects_search(projects=self.full_key), None)
+        if (self.index is not None):
+            self.sq_project = self.index.get(self.full_key)
+        else:
+            self.sq_project = next(self.sq.get_projects_search(projects=self.full_key), None)
         if (self.sq_project):
             logger.info(f"Retrieved project [{self.full_key}] from SonarQube")
 
     def create_or_update(self):
+        """
+        Create the project if it doesn't exist, then assign the quality gate and
+        profiles that differ from the ones currently assigned. Server defaults
+        don't count as assigned, so a project is never left following them.
+
+        :return: list of the actions taken, e.g. ['create', 'quality-gate', 'quality-profile:java']
+        """
+        actions = []
         if (not self.sq_project):
             self.read()
         if (not self.sq_project):
             logger.info(f"Creating project [{self.full_key}]")
-            self.sq.post_projects_create(project=self.full_key, name=self.full_name)
-            self.read()
-        if (self.quality_gate):
-            logger.info(f"Assigning quality gate [{self.quality_gate}] to [{self.full_key}]")
-            self.sq.post_qualitygates_select(gateName=self.quality_gate, projectKey=self.full_key)
-        if (self.quality_profiles):
-            self._assign_quality_profiles()
+            self.sq_project = self.sq.post_projects_create(project=self.full_key, name=self.full_name)
+            if (self.index is not None):
+                self.index.add(self.sq_project)
+            actions.append('create')
+
+        # Read the current assignments and send the writes needed concurrently;
+        # a project just created is on the defaults, nothing to read
+        created = 'create' in actions
+        with self.sq.thread_pool(Project.MAX_WORKERS) as executor:
+            gate = executor.submit(lambda: None if created else self._current_quality_gate())
+            profiles = executor.submit(lambda: {} if created else self._current_quality_profiles())
+            writes = self._quality_gate_writes(gate.result()) + self._quality_profile_writes(profiles.result())
+            for action, _ in writes:
+                actions.append(action)
+            list(executor.map(lambda write: write[1](), writes))
+
+        if (not actions):
+            logger.info(f"Project [{self.full_key}] is up to date")
+        return actions
     
     def delete(self):
         if (not self.sq_project):
             self.read()
         if (self.sq_project):
             self.sq.post_projects_delete(project=self.full_key)
+            if (self.index is not None):
+                self.index.remove(self.full_key)
             self.read()
 
+    def prune(self, keep=None, analyzed_before=None, dry_run=False):
+        """
+        Delete the suffixed 'branch' projects of this project's key, except
+        this project itself, with one search and bulk deletes.
+
+        :param keep: branch names whose projects are kept
+        :param analyzed_before: only prune projects last analyzed before this date
+        :param dry_run: only list the projects that would be deleted
+        :return: keys of the projects pruned (or to prune when dry_run)
+        """
+        kept = {self.format(self.key, self.key_delimiter, self.sanitise(branch)) for branch in keep or []}
+        kept.add(self.full_key)
+        prefix = f'{self.key}{self.key_delimiter}'
+        if (self.index is not None and not analyzed_before):
+            projects = self.index.with_prefix(prefix)
+        else:
+            args = {'q': self.key}
+            if (analyzed_before):
+                args['analyzedBefore'] = analyzed_before
+            projects = self.sq.get_projects_search(**args)
+        stale = sorted(project['key'] for project in projects
+                       if project['key'].startswith(prefix) and project['key'] not in kept)
+
+        for i in range(0, len(stale), Project.BULK_DELETE_BATCH_SIZE):
+            batch = stale[i:i + Project.BULK_DELETE_BATCH_SIZE]
+            if (dry_run):
+                logger.info(f"Would delete projects {batch}")
+            else:
+                logger.info(f"Deleting projects {batch}")
+                self.sq.post_projects_bulk_delete(projects=','.join(batch))
+                if (self.index is not None):
+                    for key in batch:
+                        self.index.remove(key)
+        return stale
+
     def sanitise(self, value):
         # handling 'feature/branch' case for now
         # consider more sophisticated cleanup
@@ -67,8 +135,145 @@ class Project(object):
     def format(self, prefix, delimiter, suffix):
         return prefix if not suffix else f'{prefix}{delimiter}{suffix}'
         
-    def _assign_quality_profiles(self):
-        for lang in self.quality_profiles.keys():
-            profile = self.quality_profiles[lang]
-            logger.info(f"Assigning quality profile [{profile}] for language [{lang}] to [{self.full_key}]")
-            self.sq.post_qualityprofiles_add_project(language = lang, project = self.full_key, qualityProfile = profile)
+    def _current_quality_gate(self):
+        if (not self.quality_gate):
+            return None
+        gate = self.sq.get_qualitygates_get_by_project(project=self.full_key)
+        # a project on the default gate follows it when the default changes, it isn't assigned
+        return gate['name'] if gate and not gate.get('default') else None
+
+    def _current_quality_profiles(self):
+        if (not self.quality_profiles):
+            return {}
+        profiles = self.sq.get_qualityprofiles_search(project=self.full_key) or []
+        return {profile['language']: profile['name'] for profile in profiles if not profile.get('isDefault')}
+
+    def _quality_gate_writes(self, current):
+        if (not self.quality_gate or self.quality_gate == current):
+            return []
+        logger.info(f"Assigning quality gate [{self.quality_gate}] to [{self.full_key}]")
+        return [('quality-gate', lambda: self.sq.post_qualitygates_select(gateName=self.quality_gate,
+                                                                         projectKey=self.full_key))]
+
+    def _quality_profile_writes(self, current):
+        writes = []
+        for lang, profile in (self.quality_profiles or {}).items():
+            if (current.get(lang) != profile):
+                logger.info(f"Assigning quality profile [{profile}] for language [{lang}] to [{self.full_key}]")
+                writes.append((f'quality-profile:{lang}', self._add_quality_profile(lang, profile)))
+        return writes
+
+    def _add_quality_profile(self, lang, profile):
+        return lambda: self.sq.post_qualityprofiles_add_project(language = lang, project = self.full_key,
+                                                               qualityProfile = profile)
+
+
+class ProjectIndex(object):
+    """
+    In-memory index of all SonarQube projects, loaded with a few maximal
+    pages, so that many Projects can be resolved without a search each.
+
+    Projects given this index keep it up to date as they create and delete
+    projects; changes made elsewhere are picked up with refresh().
+
+    A search only pages through the first 10,000 projects. On larger servers
+    the index is partial: keys it doesn't hold are looked up with a search.
+    """
+
+    # Project keys per search when refreshing given keys
+    REFRESH_BATCH_SIZE = 100
+
+    def __init__(self, sq=None):
+        self.sq = sq or SonarQube()
+        self._projects = None
+        self._keys = []
+        self.partial = False
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    def load(self):
+        pager = SonarQube.PROJECTS_ENDPOINT.pager
+        projects = self.sq.get_projects_search(ps=pager.max_page_size)
+        by_key = {project['key']: project for project in projects}
+        # the listing stops at max_results, there may be more projects
+        partial = len(by_key) >= pager.max_results
+        with self._lock:
+            self._projects = by_key
+            self._keys = sorted(by_key)
+            self.partial = partial
+        if (partial):
+            logger.warning(f"Indexed the first {len(by_key)} projects only, others will be searched for")
+        else:
+            logger.info(f"Indexed {len(by_key)} projects")
+
+    def _loaded(self):
+        # Load once, even when first used from several threads
+        if (self._projects is None):
+            with self._load_lock:
+                if (self._projects is None):
+                    self.load()
+        return self._projects
+
+    def get(self, key):
+        project = self._loaded().get(key)
+        if (project is None and self.partial):
+            project = next(self.sq.get_projects_search(projects=key), None)
+            if (project is not None):
+                self.add(project)
+        return project
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        # projects held, fewer than on the server when partial
+        return len(self._loaded())
+
+    def with_prefix(self, prefix):
+        """
+        Return the projects whose key starts with prefix, e.g. 'my-project:'
+        for every suffixed variant of 'my-project'.
+        """
+        projects = self._loaded()
+        if (self.partial):
+            found = self.sq.get_projects_search(q=prefix)
+            return sorted((project for project in found if project['key'].startswith(prefix)),
+                          key=lambda project: project['key'])
+        with self._lock:
+            start = bisect_left(self._keys, prefix)
+            keys = []
+            for key in self._keys[start:]:
+                if (not key.startswith(prefix)):
+                    break
+                keys.append(key)
+            return [projects[key] for key in keys]
+
+    def add(self, project):
+        self._loaded()
+        with self._lock:
+            if (project['key'] not in self._projects):
+                insort(self._keys, project['key'])
+            self._projects[project['key']] = project
+
+    def remove(self, key):
+        self._loaded()
+        with self._lock:
+            if (self._projects.pop(key, None) is not None):
+                del self._keys[bisect_left(self._keys, key)]
+
+    def refresh(self, keys=None):
+        """
+        Reload the given project keys from SonarQube, or every project.
+        """
+        if (keys is None):
+            self.load()
+            return
+        keys = list(keys)
+        for i in range(0, len(keys), ProjectIndex.REFRESH_BATCH_SIZE):
+            batch = keys[i:i + ProjectIndex.REFRESH_BATCH_SIZE]
+            found = {project['key']: project for project in self.sq.get_projects_search(projects=','.join(batch))}
+            for key in batch:
+                if (key in found):
+                    self.add(found[key])
+                else:
+                    self.remove(key)
@@ -0,0 +1,114 @@
+"""
+This module contains a client querying several SonarQube servers as one:
+the same query runs against every instance concurrently and their results
+are merged into one stream as they arrive, each tagged with its instance.
+"""
+import logging
+import queue
+import threading
+from .api import SonarQube
+
+logger = logging.getLogger('sonarqube.federated')
+
+# Marks the end of an instance's results in the merged stream
+_DONE = object()
+
+
+class FederatedSonarQube:
+
+    """
+    Queries several SonarQube instances concurrently, each with its own
+    client and connection pool.
+
+    federation = FederatedSonarQube({
+        'emea': {'url': 'https://sonar.emea.example.com', 'token': emea_token},
+        'apac': {'url': 'https://sonar.apac.example.com', 'token': apac_token},
+    })
+    for instance, project in federation.get_projects_search():
+        ...
+
+    An instance failing doesn't stop the others: its results end early and
+    its exception is recorded in `errors`, by instance name.
+    """
+
+    # Items buffered ahead of the consumer, across instances
+    BUFFER_SIZE = 1000
+
+    def __init__(self, instances, **options):
+        """
+        :param instances: dict of instance name to a SonarQube, or to the keyword
+            arguments creating one (url, token, ...)
+        :param options: keyword arguments shared by the SonarQube instances created,
+            e.g. page_workers or retry
+        """
+        self.instances = {name: instance if isinstance(instance, SonarQube) else SonarQube(**dict(options, **instance))
+                          for name, instance in instances.items()}
+        self.errors = {}
+
+    def query(self, fetch):
+        """
+        Call fetch(sq) for every instance concurrently, yielding (instance name,
+        item) for each item of the iterables returned, as they arrive.
+
+        Errors are recorded in `errors`, reset by each query.
+        """
+        self.errors = {}
+        results = queue.Queue(maxsize=FederatedSonarQube.BUFFER_SIZE)
+        stopped = threading.Event()
+
+        def put(value):
+            # give up once the consumer has stopped reading
+            while not stopped.is_set():
+                try:
+                    results.put(value, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def produce(name, sq):
+            try:
+                for item in fetch(sq):
+                    if not put((name, item)):
+                        return
+            except Exception as e:
+                logger.warning(f'Query of instance [{name}] failed: {e}')
+                self.errors[name] = e
+            finally:
+                put((name, _DONE))
+
+        threads = [threading.Thread(target=produce, args=(name, sq), name=f'federated-{name}', daemon=True)
+                   for name, sq in self.instances.items()]
+        for thread in threads:
+            thread.start()
+        try:
+            running = len(threads)
+            while running:
+                name, item = results.get()
+                if item is _DONE:
+                    running -= 1
+                else:
+                    yield name, item
+        finally:
+            stopped.set()
+            for thread in threads:
+                thread.join()
+
+    def paged_get(self, endpoint, **data):
+        return self.query(lambda sq: sq.paged_get(endpoint, **data))
+
+    def get_projects_search(self, **args):
+        return self.query(lambda sq: sq.get_projects_search(**args))
+
+    def get_issues(self, **args):
+        return self.query(lambda sq: sq.get_issues(**args))
+
+    def close(self):
+        for sq in self.instances.values():
+            sq.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
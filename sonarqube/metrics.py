@@ -0,0 +1,154 @@
+"""
+This module contains the request metrics SonarQube records when given a
+Metrics instance: per endpoint request counts, latency, bytes received,
+decoding time, items per page, errors and retries.
+
+Latency is measured up to the response headers, as bodies are read lazily;
+reading and decoding the body is recorded as decode time. Streamed pages are
+parsed while they are read, so they record items but not bytes or decode time.
+"""
+import json
+import threading
+from bisect import bisect_left
+
+
+class EndpointMetrics:
+
+    __slots__ = ('requests', 'errors', 'retries', 'bytes', 'latency_sum', 'latency_max', 'latency_buckets',
+                 'decode_seconds', 'pages', 'items')
+
+    def __init__(self, buckets):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.bytes = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        # one count per bucket, the last one for latencies above every bound
+        self.latency_buckets = [0] * (len(buckets) + 1)
+        self.decode_seconds = 0.0
+        self.pages = 0
+        self.items = 0
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in EndpointMetrics.__slots__}
+
+
+class Metrics:
+
+    """
+    Thread safe collector of request metrics, keyed by endpoint path.
+
+    metrics = Metrics()
+    sq = SonarQube(token=token, metrics=metrics)
+    ...
+    print(metrics.summary())
+    """
+
+    # Upper bounds of the latency histogram buckets, in seconds
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def _endpoint(self, path):
+        # callers hold the lock
+        endpoint = self._endpoints.get(path)
+        if endpoint is None:
+            endpoint = self._endpoints[path] = EndpointMetrics(Metrics.BUCKETS)
+        return endpoint
+
+    def request(self, path, seconds):
+        with self._lock:
+            endpoint = self._endpoint(path)
+            endpoint.requests += 1
+            endpoint.latency_sum += seconds
+            endpoint.latency_max = max(endpoint.latency_max, seconds)
+            endpoint.latency_buckets[bisect_left(Metrics.BUCKETS, seconds)] += 1
+
+    def decode(self, path, size, seconds):
+        with self._lock:
+            endpoint = self._endpoint(path)
+            endpoint.bytes += size
+            endpoint.decode_seconds += seconds
+
+    def page(self, path, items):
+        with self._lock:
+            endpoint = self._endpoint(path)
+            endpoint.pages += 1
+            endpoint.items += items
+
+    def error(self, path):
+        with self._lock:
+            self._endpoint(path).errors += 1
+
+    def retry(self, path):
+        with self._lock:
+            self._endpoint(path).retries += 1
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
+    def as_dict(self):
+        with self._lock:
+            return {path: endpoint.as_dict() for path, endpoint in sorted(self._endpoints.items())}
+
+    def to_json(self):
+        return json.dumps({'buckets': Metrics.BUCKETS, 'endpoints': self.as_dict()})
+
+    def to_prometheus(self, prefix='sonarqube'):
+        """
+        Metrics in the Prometheus text exposition format.
+        """
+        endpoints = self.as_dict()
+        lines = []
+
+        def family(name, kind, help, samples):
+            lines.append(f'# HELP {prefix}_{name} {help}')
+            lines.append(f'# TYPE {prefix}_{name} {kind}')
+            for suffix, labels, value in samples:
+                lines.append(f'{prefix}_{name}{suffix}{{{labels}}} {value}')
+
+        def counter(name, field, help):
+            family(name, 'counter', help,
+                   [('', f'endpoint="{path}"', endpoint[field]) for path, endpoint in endpoints.items()])
+
+        counter('requests_total', 'requests', 'Requests sent, retries included.')
+        counter('errors_total', 'errors', 'Requests that failed or returned an error status.')
+        counter('retries_total', 'retries', 'Requests retried.')
+        counter('response_bytes_total', 'bytes', 'Response bytes decoded.')
+        counter('decode_seconds_total', 'decode_seconds', 'Time spent reading and decoding responses.')
+        counter('pages_total', 'pages', 'Pages read by paged requests.')
+        counter('page_items_total', 'items', 'Items read from pages.')
+
+        samples = []
+        for path, endpoint in endpoints.items():
+            cumulative = 0
+            for bound, count in zip(Metrics.BUCKETS + ('+Inf',), endpoint['latency_buckets']):
+                cumulative += count
+                samples.append(('_bucket', f'endpoint="{path}",le="{bound}"', cumulative))
+            samples.append(('_sum', f'endpoint="{path}"', endpoint['latency_sum']))
+            samples.append(('_count', f'endpoint="{path}"', endpoint['requests']))
+        family('request_seconds', 'histogram', 'Time until the response headers were received.', samples)
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """
+        A table of the metrics per endpoint, slowest total first.
+        """
+        endpoints = sorted(self.as_dict().items(), key=lambda item: -item[1]['latency_sum'])
+        rows = [('endpoint', 'requests', 'errors', 'retries', 'mean ms', 'max ms', 'KiB', 'decode ms', 'items/page')]
+        for path, endpoint in endpoints:
+            requests = endpoint['requests']
+            rows.append((path, requests, endpoint['errors'], endpoint['retries'],
+                         f"{1000 * endpoint['latency_sum'] / requests:.1f}" if requests else '-',
+                         f"{1000 * endpoint['latency_max']:.1f}",
+                         f"{endpoint['bytes'] / 1024:.1f}",
+                         f"{1000 * endpoint['decode_seconds']:.1f}",
+                         f"{endpoint['items'] / endpoint['pages']:.1f}" if endpoint['pages'] else '-'))
+        widths = [max(len(str(row[i])) for row in rows) for i in range(len(rows[0]))]
+        return '\n'.join('  '.join(str(value).ljust(width) if i == 0 else str(value).rjust(width)
+                                   for i, (value, width) in enumerate(zip(row, widths)))
+                         for row in rows)
@@ -0,0 +1,127 @@
+"""
+This module contains the retry, rate limiting and concurrency controls that
+SonarQube.call can apply, to keep throughput at what the server sustains
+rather than failing when it throttles.
+"""
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+
+class RetryPolicy:
+
+    """
+    Retries idempotent requests that were throttled, failed transiently or
+    couldn't connect, waiting as long as Retry-After asks or else backing
+    off exponentially with jitter, up to max_backoff.
+    """
+
+    # Statuses telling the client to slow down
+    THROTTLED = (429, 503)
+
+    def __init__(self, retries=3, backoff=0.5, max_backoff=30, statuses=(429, 502, 503, 504), methods=('GET',)):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.statuses = statuses
+        self.methods = methods
+
+    def should_retry(self, method, attempt, status_code=None):
+        # status_code is None when the request failed to connect
+        return (attempt < self.retries and method in self.methods
+                and (status_code is None or status_code in self.statuses))
+
+    def delay(self, attempt, res=None):
+        retry_after = _retry_after(res.headers.get('Retry-After')) if res is not None else None
+        if retry_after is not None:
+            # retrying any earlier would only use up the retries
+            return retry_after
+        return min(self.backoff * 2 ** attempt, self.max_backoff) * random.uniform(0.5, 1.0)
+
+
+class RateLimiter:
+
+    """
+    Token bucket allowing rate requests per second on average, in bursts
+    of up to burst requests.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1, rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # take the token now, going into debt if need be, and wait for it outside the lock
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+class AdaptiveLimiter:
+
+    """
+    Limits the number of requests in flight, adapting the limit AIMD style:
+    it grows by one per limit's worth of successful requests and is cut by
+    decrease whenever the server throttles, at most once per window: requests
+    sent before the last cut were sent at the old limit, and their throttling
+    is already accounted for.
+
+    window = limiter.acquire()
+    ...
+    limiter.release(throttled, window)
+    """
+
+    def __init__(self, initial=8, min_limit=1, max_limit=64, decrease=0.5):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max_limit
+        self.decrease = decrease
+        self.limit = float(initial)
+        self._in_flight = 0
+        # number of decreases so far
+        self._window = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """
+        Wait for a slot and return the current window, to pass to release.
+        """
+        with self._condition:
+            while self._in_flight >= int(self.limit):
+                self._condition.wait()
+            self._in_flight += 1
+            return self._window
+
+    def release(self, throttled=False, window=None):
+        with self._condition:
+            self._in_flight -= 1
+            if throttled:
+                if window is None or window == self._window:
+                    self.limit = max(self.min_limit, self.limit * self.decrease)
+                    self._window += 1
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+
+def _retry_after(value):
+    # either seconds or an HTTP date
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
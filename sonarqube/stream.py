@@ -0,0 +1,104 @@
+"""
+This module contains an incremental parser for paged responses, so items can
+be handed out while the rest of the page is still being received.
+"""
+import codecs
+import json
+import re
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_decoder = json.JSONDecoder()
+
+
+class StreamedPage:
+
+    """
+    Parses a JSON object from an iterable of byte chunks, yielding each element
+    of the `items_key` array as soon as it is complete. The other top level
+    members (e.g. 'paging') are collected in `fields`, complete once iteration
+    has finished.
+    """
+
+    def __init__(self, chunks, items_key):
+        self.items_key = items_key
+        self.fields = {}
+        self._buffer = _Buffer(chunks)
+
+    def __iter__(self):
+        buffer = self._buffer
+        buffer.expect('{')
+        if buffer.skip('}'):
+            return
+        while True:
+            key = buffer.value()
+            buffer.expect(':')
+            if key == self.items_key and buffer.skip('['):
+                if not buffer.skip(']'):
+                    while True:
+                        yield buffer.value()
+                        if buffer.skip(']'):
+                            break
+                        buffer.expect(',')
+            else:
+                self.fields[key] = buffer.value()
+            if buffer.skip('}'):
+                return
+            buffer.expect(',')
+
+
+class _Buffer:
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._text = ''
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self):
+        if self._eof:
+            raise ValueError('Unexpected end of JSON response')
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            self._eof = True
+            text = self._decoder.decode(b'', final=True)
+        else:
+            text = self._decoder.decode(chunk)
+        # drop what has been parsed already
+        self._text = self._text[self._pos:] + text
+        self._pos = 0
+
+    def _peek(self):
+        while True:
+            self._pos = _WHITESPACE.match(self._text, self._pos).end()
+            if self._pos < len(self._text):
+                return self._text[self._pos]
+            self._fill()
+
+    def skip(self, char):
+        if self._peek() == char:
+            self._pos += 1
+            return True
+        return False
+
+    def expect(self, char):
+        if not self.skip(char):
+            raise ValueError(f'Expected [{char}] in JSON response, found [{self._peek()}]')
+
+    def value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self._text, self._pos)
+            except json.JSONDecodeError:
+                # incomplete, unless there is nothing more to read
+                if self._eof:
+                    raise
+                self._fill()
+                continue
+            if end == len(self._text) and not self._eof:
+                # a number could carry on in the next chunk
+                self._fill()
+                continue
+            self._pos = end
+            return value
@@ -0,0 +1,132 @@
+"""
+This module contains an incremental sync of SonarQube issues into a local
+SQLite database, for querying issues locally without exporting them again.
+
+Each project keeps a watermark, the latest issue update seen. A project's
+first sync exports all its issues, later syncs only fetch the issues updated
+since the watermark. Runs are recorded so an interrupted run resumes with
+the projects it had not finished.
+"""
+import json
+import logging
+import sqlite3
+from datetime import datetime, timezone
+from .utils import format_date, parse_date
+
+logger = logging.getLogger('sonarqube.sync')
+
+
+class IssueSync:
+
+    """
+    Keeps the issues of SonarQube projects in a SQLite database.
+
+    sync = IssueSync(sq, 'issues.db')
+    sync.sync()
+    sync.db.execute('SELECT severity, count(*) FROM issues GROUP BY severity')
+    """
+
+    # Issues upserted per transaction
+    BATCH_SIZE = 1000
+
+    COLUMNS = ('key', 'project', 'rule', 'severity', 'type', 'status', 'resolution', 'component', 'line',
+               'creationDate', 'updateDate')
+
+    def __init__(self, sq, filename):
+        self.sq = sq
+        self.db = sqlite3.connect(filename)
+        with self.db:
+            self.db.execute('CREATE TABLE IF NOT EXISTS issues (key TEXT PRIMARY KEY, project TEXT, rule TEXT, '
+                            'severity TEXT, type TEXT, status TEXT, resolution TEXT, component TEXT, line INTEGER, '
+                            'creation_date TEXT, update_date TEXT, data TEXT)')
+            self.db.execute('CREATE INDEX IF NOT EXISTS issues_project ON issues (project)')
+            self.db.execute('CREATE TABLE IF NOT EXISTS projects (project TEXT PRIMARY KEY, watermark TEXT, '
+                            'run INTEGER, synced_at TEXT)')
+            self.db.execute('CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                            'started TEXT, finished TEXT)')
+
+    def sync(self, projects=None):
+        """
+        Sync the given project keys, or every project, resuming the last run
+        if it was interrupted.
+
+        :return: dict of project key to number of issues fetched
+        """
+        run = self._run()
+        if projects is None:
+            projects = [project['key'] for project in self.sq.get_projects_search()]
+        done = {row[0] for row in self.db.execute('SELECT project FROM projects WHERE run = ?', (run,))}
+
+        fetched = {}
+        for project in projects:
+            if project in done:
+                logger.info(f'Project [{project}] already synced by run [{run}]')
+                continue
+            fetched[project] = self.sync_project(project, run)
+
+        with self.db:
+            self.db.execute('UPDATE runs SET finished = ? WHERE id = ?', (_now(), run))
+        return fetched
+
+    def sync_project(self, project, run=None):
+        row = self.db.execute('SELECT watermark FROM projects WHERE project = ?', (project,)).fetchone()
+        watermark = parse_date(row[0]) if row and row[0] else None
+        if watermark:
+            logger.info(f'Syncing issues of [{project}] updated since [{format_date(watermark)}]')
+            issues = self._updated_issues(project, watermark)
+        else:
+            logger.info(f'Syncing all issues of [{project}]')
+            issues = self.sq.export_issues(projects=project)
+
+        count = 0
+        latest = watermark
+        batch = []
+        for issue in issues:
+            updated = parse_date(issue['updateDate'])
+            latest = updated if latest is None or updated > latest else latest
+            batch.append(issue)
+            if len(batch) >= IssueSync.BATCH_SIZE:
+                count += self._upsert(batch)
+                batch = []
+        count += self._upsert(batch)
+
+        # Only move the watermark once every issue is stored
+        with self.db:
+            self.db.execute('INSERT OR REPLACE INTO projects VALUES (?, ?, ?, ?)',
+                            (project, format_date(latest) if latest else None, run, _now()))
+        logger.info(f'Synced {count} issues of [{project}]')
+        return count
+
+    def _updated_issues(self, project, watermark):
+        # Newest updates first, until reaching the watermark; issues updated at
+        # the watermark itself are fetched again, upserting them is harmless
+        pager = self.sq.ISSUES_ENDPOINT.pager
+        count = 0
+        for issue in self.sq.get_issues(projects=project, s='UPDATE_DATE', asc='false'):
+            if parse_date(issue['updateDate']) < watermark:
+                return
+            count += 1
+            yield issue
+        if count >= pager.max_results:
+            # more updates than can be paged through, export them instead
+            logger.info(f'More than {pager.max_results} issues of [{project}] updated, exporting all')
+            yield from self.sq.export_issues(projects=project)
+
+    def _upsert(self, issues):
+        with self.db:
+            self.db.executemany(f'INSERT OR REPLACE INTO issues VALUES ({", ".join("?" * 12)})',
+                                [tuple(issue.get(column) for column in IssueSync.COLUMNS) + (json.dumps(issue),)
+                                 for issue in issues])
+        return len(issues)
+
+    def _run(self):
+        row = self.db.execute('SELECT id, finished FROM runs ORDER BY id DESC LIMIT 1').fetchone()
+        if row and row[1] is None:
+            logger.info(f'Resuming interrupted sync run [{row[0]}]')
+            return row[0]
+        with self.db:
+            return self.db.execute('INSERT INTO runs (started) VALUES (?)', (_now(),)).lastrowid
+
+
+def _now():
+    return format_date(datetime.now(timezone.utc).replace(microsecond=0))
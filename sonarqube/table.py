@@ -0,0 +1,422 @@
+"""
+This module contains compact columnar tables for holding large exports in
+memory for analysis.
+
+Repeated strings (rule, severity, component, ...) are dictionary encoded,
+numbers are kept in typed arrays. NumPy and pyarrow are used when installed
+but not required.
+"""
+import re
+from array import array
+from calendar import timegm
+from collections import Counter
+from datetime import datetime, timezone
+from .utils import format_date
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Numeric value for a missing line, effort or date
+MISSING = -1
+NAN = float('nan')
+
+
+class Categorical:
+
+    """
+    Dictionary encoded column: each distinct value is stored once and rows
+    hold its integer code.
+    """
+
+    __slots__ = ('categories', 'codes', '_codes_by_value')
+
+    def __init__(self, categories=None):
+        self.categories = list(categories or [])
+        self.codes = array('I')
+        self._codes_by_value = {value: code for code, value in enumerate(self.categories)}
+
+    def append(self, value):
+        code = self._codes_by_value.get(value)
+        if code is None:
+            code = self._codes_by_value[value] = len(self.categories)
+            self.categories.append(value)
+        self.codes.append(code)
+
+    def code(self, value):
+        return self._codes_by_value.get(value)
+
+    def take(self, indices):
+        column = Categorical(self.categories)
+        codes = self.codes
+        column.codes = array('I', (codes[i] for i in indices))
+        return column
+
+    def __getitem__(self, index):
+        return self.categories[self.codes[index]]
+
+    def __len__(self):
+        return len(self.codes)
+
+
+class IssueRow:
+
+    """
+    Lightweight view of one row of an IssueTable, e.g. row.severity.
+    """
+
+    __slots__ = ('_table', '_index')
+
+    def __init__(self, table, index):
+        self._table = table
+        self._index = index
+
+    def __getattr__(self, name):
+        try:
+            return self._table.value(name, self._index)
+        except KeyError:
+            raise AttributeError(name)
+
+    def as_dict(self):
+        return {name: self._table.value(name, self._index) for name in self._table.columns}
+
+    def __repr__(self):
+        return f'IssueRow({self.as_dict()})'
+
+
+class IssueTable:
+
+    """
+    Columnar store of issues as returned by /api/issues/search.
+
+    Build with IssueTable.from_issues(sq.get_issues(...)), then filter with
+    where(), count with count_by() or export with to_numpy()/to_arrow().
+    Efforts are in minutes and dates in seconds since the epoch, MISSING
+    when absent.
+    """
+
+    # issue field -> column
+    CATEGORICAL = ('rule', 'severity', 'type', 'status', 'resolution', 'component', 'project', 'author', 'assignee')
+    NUMERIC = {'line': 'line', 'effort': 'effort', 'creationDate': 'creation_date',
+               'updateDate': 'update_date', 'closeDate': 'close_date'}
+    TEXT = ('key', 'message')
+
+    # SonarQube counts a day of effort as 8 hours
+    HOURS_PER_DAY = 8
+
+    __slots__ = ('_columns',)
+
+    def __init__(self):
+        self._columns = {}
+        for name in IssueTable.CATEGORICAL:
+            self._columns[name] = Categorical()
+        for name in IssueTable.NUMERIC.values():
+            self._columns[name] = array('q')
+        for name in IssueTable.TEXT:
+            self._columns[name] = []
+
+    @classmethod
+    def from_issues(cls, issues):
+        table = cls()
+        table.extend(issues)
+        return table
+
+    @property
+    def columns(self):
+        return list(self._columns)
+
+    def append(self, issue):
+        columns = self._columns
+        for name in IssueTable.CATEGORICAL:
+            columns[name].append(issue.get(name))
+        columns['line'].append(issue.get('line', MISSING))
+        columns['effort'].append(_parse_effort(issue.get('effort')))
+        columns['creation_date'].append(_parse_timestamp(issue.get('creationDate')))
+        columns['update_date'].append(_parse_timestamp(issue.get('updateDate')))
+        columns['close_date'].append(_parse_timestamp(issue.get('closeDate')))
+        for name in IssueTable.TEXT:
+            columns[name].append(issue.get(name))
+
+    def extend(self, issues):
+        for issue in issues:
+            self.append(issue)
+
+    def __len__(self):
+        return len(self._columns['key'])
+
+    def __getitem__(self, index):
+        if not -len(self) <= index < len(self):
+            raise IndexError(index)
+        return IssueRow(self, index % len(self))
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield IssueRow(self, index)
+
+    def value(self, name, index):
+        return self._columns[name][index]
+
+    def column(self, name):
+        """
+        Return the values of a column; the codes of a categorical column
+        map onto categories(name).
+        """
+        column = self._columns[name]
+        return column.codes if isinstance(column, Categorical) else column
+
+    def categories(self, name):
+        return self._columns[name].categories
+
+    def where(self, **conditions):
+        """
+        Return a new table of the rows matching all conditions, each being
+        column=value or column=[values], e.g. where(severity=['MAJOR', 'BLOCKER'], type='BUG').
+        """
+        return self.take(self.indices(**conditions))
+
+    def indices(self, **conditions):
+        mask = None
+        for name, values in conditions.items():
+            if isinstance(values, (str, int)) or values is None:
+                values = [values]
+            column = self._columns[name]
+            if isinstance(column, Categorical):
+                # compare integer codes rather than strings
+                values = [column.code(value) for value in values if column.code(value) is not None]
+            matches = _mask(self.column(name), set(values))
+            mask = matches if mask is None else _and(mask, matches)
+        if mask is None:
+            return range(len(self))
+        if numpy is not None and isinstance(mask, numpy.ndarray):
+            return numpy.flatnonzero(mask).tolist()
+        return [index for index, match in enumerate(mask) if match]
+
+    def take(self, indices):
+        table = IssueTable()
+        for name, column in self._columns.items():
+            if isinstance(column, Categorical):
+                table._columns[name] = column.take(indices)
+            elif isinstance(column, array):
+                table._columns[name] = array(column.typecode, (column[i] for i in indices))
+            else:
+                table._columns[name] = [column[i] for i in indices]
+        return table
+
+    def count_by(self, name):
+        """
+        Return a Counter of rows per value of a categorical column.
+        """
+        column = self._columns[name]
+        if numpy is not None:
+            counts = numpy.bincount(numpy.frombuffer(column.codes, dtype=numpy.uint32),
+                                    minlength=len(column.categories))
+            return Counter({column.categories[code]: int(count) for code, count in enumerate(counts) if count})
+        return Counter({column.categories[code]: count for code, count in Counter(column.codes).items()})
+
+    def to_numpy(self):
+        """
+        Return a dict of column name to NumPy array; categorical columns
+        hold codes into categories(name).
+        """
+        if numpy is None:
+            raise ImportError('to_numpy requires numpy: pip install numpy')
+        arrays = {}
+        for name in self._columns:
+            if name in IssueTable.TEXT:
+                arrays[name] = numpy.array(self._columns[name], dtype=object)
+            else:
+                arrays[name] = numpy.frombuffer(self.column(name), dtype=numpy.uint32 if name in IssueTable.CATEGORICAL
+                                                else numpy.int64).copy()
+        return arrays
+
+    def to_arrow(self):
+        """
+        Return a pyarrow Table, with dictionary arrays for categorical columns.
+        """
+        try:
+            import pyarrow
+        except ImportError:
+            raise ImportError('to_arrow requires pyarrow: pip install pyarrow')
+        arrays = {}
+        for name, column in self._columns.items():
+            if isinstance(column, Categorical):
+                arrays[name] = pyarrow.DictionaryArray.from_arrays(
+                    pyarrow.array(column.codes, type=pyarrow.uint32()), pyarrow.array(column.categories, type=pyarrow.string()))
+            elif isinstance(column, array):
+                arrays[name] = pyarrow.array(column, type=pyarrow.int64())
+            else:
+                arrays[name] = pyarrow.array(column, type=pyarrow.string())
+        return pyarrow.table(arrays)
+
+
+class MeasureMatrix:
+
+    """
+    Dense project x metric matrix of measures, as returned by
+    /api/measures/search, parsed to floats once and stored row major.
+    Missing values are NaN; values that aren't numbers (e.g. alert_status)
+    are kept in text, keyed by (project, metric).
+    """
+
+    __slots__ = ('metrics', 'projects', 'values', 'text', '_rows', '_columns')
+
+    def __init__(self, metrics):
+        self.metrics = list(metrics)
+        self.projects = []
+        self.values = array('d')
+        self.text = {}
+        self._rows = {}
+        self._columns = {metric: column for column, metric in enumerate(self.metrics)}
+
+    def add(self, projects, measures):
+        for project in projects:
+            self._row(project)
+        width = len(self.metrics)
+        for measure in measures:
+            column = self._columns.get(measure['metric'])
+            if column is None:
+                continue
+            row = self._row(measure['component'])
+            value = _measure_value(measure)
+            try:
+                self.values[row * width + column] = float(value)
+            except (TypeError, ValueError):
+                if value is not None:
+                    self.text[(measure['component'], measure['metric'])] = value
+
+    def _row(self, project):
+        row = self._rows.get(project)
+        if row is None:
+            row = self._rows[project] = len(self.projects)
+            self.projects.append(project)
+            self.values.extend([NAN] * len(self.metrics))
+        return row
+
+    def __len__(self):
+        return len(self.projects)
+
+    def value(self, project, metric):
+        return self.values[self._rows[project] * len(self.metrics) + self._columns[metric]]
+
+    def row(self, project):
+        width = len(self.metrics)
+        start = self._rows[project] * width
+        return dict(zip(self.metrics, self.values[start:start + width]))
+
+    def column(self, metric):
+        return self.values[self._columns[metric]::len(self.metrics)]
+
+    def to_numpy(self):
+        """
+        Return the values as a NumPy array of shape (projects, metrics).
+        """
+        if numpy is None:
+            raise ImportError('to_numpy requires numpy: pip install numpy')
+        return numpy.frombuffer(self.values, dtype=numpy.float64).reshape(len(self.projects), len(self.metrics)).copy()
+
+
+class MeasureHistory:
+
+    """
+    Measures history of one project, as returned by /api/measures/search_history:
+    analysis timestamps (seconds since the epoch) and, per metric, an aligned
+    array of values, NaN where the analysis has no numeric value.
+    """
+
+    __slots__ = ('project', 'metrics', 'timestamps', 'values')
+
+    def __init__(self, project, metrics):
+        self.project = project
+        self.metrics = list(metrics)
+        self.timestamps = array('q')
+        self.values = {metric: array('d') for metric in self.metrics}
+
+    def add(self, measures):
+        """
+        Add search_history measures, ignoring analyses already held.
+        """
+        points = {}
+        for measure in measures:
+            for point in measure.get('history', []):
+                points.setdefault(_parse_timestamp(point['date']), {})[measure['metric']] = point.get('value')
+        last = self.timestamps[-1] if self.timestamps else None
+        dates = sorted(timestamp for timestamp in points if last is None or timestamp > last)
+
+        # parse each metric's new values in one go
+        self.timestamps.extend(dates)
+        for metric, values in self.values.items():
+            values.extend(_floats(points[timestamp].get(metric) for timestamp in dates))
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def last_date(self):
+        if not self.timestamps:
+            return None
+        return format_date(datetime.fromtimestamp(self.timestamps[-1], timezone.utc))
+
+    def to_numpy(self):
+        """
+        Return a (timestamps, {metric: values}) tuple of NumPy arrays.
+        """
+        if numpy is None:
+            raise ImportError('to_numpy requires numpy: pip install numpy')
+        return (numpy.frombuffer(self.timestamps, dtype=numpy.int64).copy(),
+                {metric: numpy.frombuffer(values, dtype=numpy.float64).copy() for metric, values in self.values.items()})
+
+
+def _floats(values):
+    floats = array('d')
+    for value in values:
+        try:
+            floats.append(float(value))
+        except (TypeError, ValueError):
+            floats.append(NAN)
+    return floats
+
+
+def _measure_value(measure):
+    # new_* metrics carry their value in the leak period instead
+    if 'value' in measure:
+        return measure['value']
+    if 'period' in measure:
+        return measure['period'].get('value')
+    if measure.get('periods'):
+        return measure['periods'][0].get('value')
+    return None
+
+
+def _mask(values, wanted):
+    if numpy is not None and isinstance(values, array):
+        return numpy.isin(numpy.asarray(values), list(wanted))
+    return [value in wanted for value in values]
+
+
+def _and(mask, other):
+    if numpy is not None and isinstance(mask, numpy.ndarray) and isinstance(other, numpy.ndarray):
+        return mask & other
+    return [a and b for a, b in zip(mask, other)]
+
+
+_EFFORT = re.compile(r'(?:(\d+)d)?\s*(?:(\d+)h)?\s*(?:(\d+)min)?')
+
+
+def _parse_effort(value):
+    # e.g. '1d2h30min' to minutes
+    match = _EFFORT.fullmatch(value) if value else None
+    if not match:
+        return MISSING
+    days, hours, minutes = match.groups()
+    return ((int(days or 0) * IssueTable.HOURS_PER_DAY + int(hours or 0)) * 60) + int(minutes or 0)
+
+
+def _parse_timestamp(value):
+    # '2022-01-01T10:00:00+0100', sliced rather than strptime'd for speed
+    if not value:
+        return MISSING
+    seconds = timegm((int(value[0:4]), int(value[5:7]), int(value[8:10]),
+                      int(value[11:13]), int(value[14:16]), int(value[17:19])))
+    sign = -1 if value[19] == '-' else 1
+    offset = sign * (int(value[20:22]) * 3600 + int(value[22:24]) * 60)
+    return seconds - offset
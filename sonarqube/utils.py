@@ -1,6 +1,9 @@
 __author__ = 'kako'
 
+import json
 import sys
+from collections import deque
+from datetime import datetime, timezone
 
 
 # Encoding cleanup function
@@ -8,3 +11,76 @@ if sys.version_info.major == 3:
     utf_encode = lambda x: x
 else:
     utf_encode = lambda x: x.encode('utf-8')
+
+
+def bounded_map(executor, fn, iterable, window):
+    """
+    Like executor.map, but with at most `window` calls in flight at a time.
+    Results are yielded in input order; outstanding calls are cancelled if
+    the consumer stops early.
+    """
+    pending = deque()
+    try:
+        for args in iterable:
+            pending.append(executor.submit(fn, args))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def chunked(iterable, size):
+    """
+    Yield lists of up to size items from iterable.
+    """
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+JSON_DECODERS = ('orjson', 'msgspec', 'json')
+
+
+def json_decoder(name=None):
+    """
+    Return a function decoding JSON from bytes. By default the fastest
+    installed of orjson and msgspec, falling back on the standard library.
+
+    :param name: one of JSON_DECODERS to require a specific decoder
+    """
+    if name and name not in JSON_DECODERS:
+        raise ValueError(f'Unknown JSON decoder [{name}], expected one of {JSON_DECODERS}')
+    for candidate in [name] if name else JSON_DECODERS:
+        try:
+            if candidate == 'orjson':
+                import orjson
+                return orjson.loads
+            if candidate == 'msgspec':
+                import msgspec
+                return msgspec.json.decode
+        except ImportError:
+            if name:
+                raise
+    return json.loads
+
+
+def parse_date(value):
+    """
+    Parse a date or datetime as accepted and returned by SonarQube,
+    e.g. '2022-01-01' or '2022-01-01T10:00:00+0100'.
+    """
+    if 'T' in value:
+        return datetime.strptime(value, '%Y-%m-%dT%H:%M:%S%z')
+    return datetime.strptime(value, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+
+
+def format_date(value):
+    return value.strftime('%Y-%m-%dT%H:%M:%S%z')
@@ -0,0 +1,59 @@
+import pytest
+import asyncio
+from sonarqube.api import Endpoint, Pager
+from sonarqube.exceptions import ClientError
+
+web = pytest.importorskip('aiohttp.web')
+from sonarqube.aio import AsyncSonarQube
+
+
+def test_get_returns_item_in_response():
+    async def handler(request):
+        return web.json_response({'item': {'hello': 'world'}})
+
+    async def scenario(sq):
+        return await sq.get(Endpoint('/endpoint', response_item='item'))
+
+    assert 'world' == __run([('/endpoint', handler)], scenario)['hello']
+
+
+def test_response_404_should_raise_client_error():
+    async def scenario(sq):
+        return await sq.get(Endpoint('/missing'))
+
+    with pytest.raises(ClientError):
+        __run([], scenario)
+
+
+def test_paged_get_yields_pages_in_order():
+    async def handler(request):
+        page_index, page_size = int(request.query.get('p', 1)), int(request.query['ps'])
+        first = (page_index - 1) * page_size
+        return web.json_response({
+            'paging': {'pageIndex': page_index, 'pageSize': page_size, 'total': 7},
+            'items': [{'n': n + 1} for n in range(first, min(first + page_size, 7))]
+        })
+
+    async def scenario(sq):
+        endpoint = Endpoint('/endpoint', pager=Pager(response_items='items', max_page_size=2))
+        return [item['n'] async for item in sq.paged_get(endpoint)]
+
+    assert [1, 2, 3, 4, 5, 6, 7] == __run([('/endpoint', handler)], scenario)
+
+
+def __run(routes, scenario):
+    async def main():
+        app = web.Application()
+        for path, handler in routes:
+            app.router.add_get(path, handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            async with AsyncSonarQube(host='http://127.0.0.1', port=port, concurrency=2) as sq:
+                return await scenario(sq)
+        finally:
+            await runner.cleanup()
+    return asyncio.run(main())
@@ -1,6 +1,7 @@
 import pytest
 import json
 import httpretty
+from datetime import datetime, timedelta, timezone
 from sonarqube.api import SonarQube
 from sonarqube.api import Endpoint
 from sonarqube.api import Pager
@@ -25,6 +26,14 @@ def test_endpoint_url_should_use_base_path():
         test.endpoint_url(test.AUTH_VALIDATION_ENDPOINT)
 
 
+def test_class_level_defaults_can_be_overridden(monkeypatch):
+    monkeypatch.setattr(SonarQube, 'DEFAULT_HOST', 'http://sonar.example.com')
+    monkeypatch.setattr(SonarQube, 'DEFAULT_TOKEN', 'token')
+    sq = SonarQube()
+    assert 'http://sonar.example.com:9000' == sq._url
+    assert 'token' == sq._token
+
+
 @httpretty.activate
 def test_response_400_should_raise_validation_error_with_message():
 
@@ -77,6 +86,24 @@ def test_get_returns_item_in_response():
     assert 'world' == SonarQube().get(Endpoint('/endpoint', response_item='item'))['hello']
 
 
+@httpretty.activate
+def test_get_uses_configured_json_decoder():
+    httpretty.register_uri(httpretty.GET, 'http://localhost:9000/endpoint',
+                           body='{"item":{"hello":"world"}}')
+    decoded = []
+
+    def loads(content):
+        decoded.append(content)
+        return json.loads(content)
+    assert 'world' == SonarQube(json_decoder=loads).get(Endpoint('/endpoint', response_item='item'))['hello']
+    assert [b'{"item":{"hello":"world"}}'] == decoded
+
+
+def test_unknown_json_decoder_is_rejected():
+    with pytest.raises(ValueError):
+        SonarQube(json_decoder='yaml')
+
+
 @httpretty.activate
 def test_paged_get_returns_single_page():
     httpretty.register_uri(httpretty.GET, 'http://localhost:9000/endpoint?p=1',
@@ -96,12 +123,202 @@ def test_paged_get_returns_multiple_pages():
     generator = SonarQube().paged_get(Endpoint('/endpoint', pager=Pager(response_items='items')))
     assert 2 == len(list(generator))
 
+@httpretty.activate
+def test_paged_get_with_page_workers_yields_pages_in_order():
+    httpretty.register_uri(httpretty.GET, 'http://localhost:9000/endpoint',
+                           body=__paged_callback(total=7))
+    generator = SonarQube(page_workers=3).paged_get(
+        Endpoint('/endpoint', pager=Pager(response_items='items', max_page_size=2)))
+    assert [1, 2, 3, 4, 5, 6, 7] == [item['n'] for item in generator]
+    assert {'2'} == {r.querystring['ps'][0] for r in httpretty.latest_requests()}
+
+
+@httpretty.activate
+def test_export_issues_splits_query_past_result_cap(monkeypatch):
+    monkeypatch.setattr(SonarQube.ISSUES_ENDPOINT.pager, 'max_results', 3)
+    httpretty.register_uri(httpretty.GET, 'http://localhost:9000/api/issues/search',
+                           body=__issues_callback(count=10))
+    keys = [issue['key'] for issue in SonarQube().export_issues(workers=2)]
+    assert ['issue-{}'.format(n) for n in range(10)] == keys
+    # slices are paged at the largest page size, counts ask for one issue
+    assert {'1', '500'} == {r.querystring['ps'][0] for r in httpretty.latest_requests()}
+
+
+@httpretty.activate
+def test_export_issues_splits_issues_created_in_the_same_second_on_facets(monkeypatch):
+    monkeypatch.setattr(SonarQube.ISSUES_ENDPOINT.pager, 'max_results', 3)
+    httpretty.register_uri(httpretty.GET, 'http://localhost:9000/api/issues/search',
+                           body=__issues_callback(count=30, hours_apart=0))
+    keys = [issue['key'] for issue in SonarQube().export_issues(workers=2)]
+    assert ['issue-{}'.format(n) for n in range(30)] == sorted(keys, key=lambda key: int(key.split('-')[1]))
+
+
+def test_export_issues_rejects_created_in_last():
+    with pytest.raises(ValueError):
+        next(SonarQube().export_issues(createdInLast='1w'))
+
+
+@httpretty.activate
+def test_export_issues_splits_created_at_on_facets_only(monkeypatch):
+    monkeypatch.setattr(SonarQube.ISSUES_ENDPOINT.pager, 'max_results', 3)
+    httpretty.register_uri(httpretty.GET, 'http://localhost:9000/api/issues/search',
+                           body=__issues_callback(count=10))
+    assert 10 == len(list(SonarQube().export_issues(createdAt='2022-01-01T00:00:00+0000')))
+    assert not [r for r in httpretty.latest_requests() if 'createdAfter' in r.querystring]
+
+
+@httpretty.activate
+def test_get_issues_with_rules_resolves_rules_in_bulk():
+    httpretty.register_uri(httpretty.GET, 'http://localhost:9000/api/issues/search',
+                           body=json.dumps({'paging': {'pageIndex': 1, 'pageSize': 100, 'total': 3},
+                                            'issues': [{'rule': 'py:S1'}, {'rule': 'py:S2'}, {'rule': 'py:S1'}]}))
+    httpretty.register_uri(httpretty.GET, 'http://localhost:9000/api/rules/search',
+                           body=json.dumps({'paging': {'pageIndex': 1, 'pageSize': 100, 'total': 2},
+                                            'rules': [{'key': 'py:S1', 'name': 'one'}, {'key': 'py:S2', 'name': 'two'}]}))
+    sq = SonarQube()
+    issues = list(sq.get_issues(with_rules=True))
+    assert ['one', 'two', 'one'] == [issue['ruleDetails']['name'] for issue in issues]
+    assert {'py:S1,py:S2'} == {r.querystring['rule_keys'][0] for r in httpretty.latest_requests()
+                               if r.path.startswith('/api/rules/search')}
+
+    # memoized
+    sq.resolve_rules(['py:S2'])
+    assert 2 == len(httpretty.latest_requests())
+
+
+@httpretty.activate
+def test_resolve_rules_memoizes_unknown_rules():
+    httpretty.register_uri(httpretty.GET, 'http://localhost:9000/api/rules/search',
+                           body=json.dumps({'paging': {'pageIndex': 1, 'pageSize': 100, 'total': 1},
+                                            'rules': [{'key': 'external_eslint:no-undef', 'name': 'one'}]}))
+    sq = SonarQube()
+    assert ['external_eslint:no-undef'] == list(sq.resolve_rules(['external_eslint:no-undef', 'py:gone']))
+    assert 'true' == httpretty.last_request().querystring['include_external'][0]
+
+    assert {} == sq.resolve_rules(['py:gone'])
+    assert 1 == len(httpretty.latest_requests())
+
+
+@httpretty.activate
+def test_issue_counts_splits_query_when_facet_is_truncated(monkeypatch):
+    monkeypatch.setattr(SonarQube, 'ISSUE_FACET_LIMIT', 2)
+    rules = ['r{}'.format(n) for n in range(6)]
+    issues = [{'rule': rule, 'severity': ('MAJOR', 'MINOR', 'INFO')[n // 2], 'resolved': ('false', 'true')[n % 2]}
+              for n, rule in enumerate(rules) for _ in range(n + 1)]
+
+    def callback(request, uri, headers):
+        qs = {k: v[0] for k, v in request.querystring.items()}
+        matched = [i for i in issues if qs.get('severities', i['severity']) == i['severity']
+                   and qs.get('resolved', i['resolved']) == i['resolved']]
+        counts = {}
+        for issue in matched:
+            counts[issue['rule']] = counts.get(issue['rule'], 0) + 1
+        # like SonarQube, only the top facet values are returned
+        values = sorted(counts.items(), key=lambda c: -c[1])[:2]
+        body = {'paging': {'pageIndex': 1, 'pageSize': 1, 'total': len(matched)},
+                'facets': [{'property': 'rules', 'values': [{'val': v, 'count': c} for v, c in values]}]}
+        return [200, headers, json.dumps(body)]
+    httpretty.register_uri(httpretty.GET, 'http://localhost:9000/api/issues/search', body=callback)
+
+    counts = SonarQube().issue_counts('rules', workers=2)
+    assert {rule: sum(1 for i in issues if i['rule'] == rule) for rule in rules} == counts
+
+
+@httpretty.activate
+def test_issue_counts_takes_facet_without_untagged_issues_as_complete():
+    httpretty.register_uri(httpretty.GET, 'http://localhost:9000/api/issues/search',
+                           body=json.dumps({'paging': {'pageIndex': 1, 'pageSize': 1, 'total': 3},
+                                            'facets': [{'property': 'tags', 'values': [{'val': 'cert', 'count': 1}]}]}))
+    assert {'cert': 1} == SonarQube().issue_counts('tags')
+    assert 1 == len(httpretty.latest_requests())
+
+
+@httpretty.activate
+def test_portfolio_measures_batches_projects(monkeypatch):
+    monkeypatch.setattr(SonarQube, 'MEASURES_SEARCH_BATCH_SIZE', 2)
+    httpretty.register_uri(httpretty.GET, 'http://localhost:9000/api/projects/search',
+                           body=json.dumps({'paging': {'pageIndex': 1, 'pageSize': 100, 'total': 3},
+                                            'components': [{'key': 'a'}, {'key': 'b'}, {'key': 'c'}]}))
+
+    def measures(request, uri, headers):
+        keys = request.querystring['projectKeys'][0].split(',')
+        body = {'measures': [{'component': key, 'metric': 'ncloc', 'value': str(len(key) * 10)} for key in keys]}
+        return [200, headers, json.dumps(body)]
+    httpretty.register_uri(httpretty.GET, 'http://localhost:9000/api/measures/search', body=measures)
+
+    matrix = SonarQube().portfolio_measures(['ncloc', 'coverage'], workers=2)
+    assert ['a', 'b', 'c'] == matrix.projects
+    assert [10.0, 10.0, 10.0] == list(matrix.column('ncloc'))
+    assert 2 == len([r for r in httpretty.latest_requests() if r.path.startswith('/api/measures/search')])
+
+
+@httpretty.activate
+def test_measures_history_refreshes_from_last_date():
+    def history(request, uri, headers):
+        dates = ['2022-01-01T00:00:00+0000', '2022-01-02T00:00:00+0000']
+        if 'from' in request.querystring:
+            dates = dates[1:] + ['2022-01-03T00:00:00+0000']
+        body = {'paging': {'pageIndex': 1, 'pageSize': 1000, 'total': len(dates)},
+                'measures': [{'metric': 'ncloc', 'history': [{'date': d, 'value': '1'} for d in dates]}]}
+        return [200, headers, json.dumps(body)]
+    httpretty.register_uri(httpretty.GET, 'http://localhost:9000/api/measures/search_history', body=history)
+
+    sq = SonarQube()
+    histories = sq.measures_history(['a', 'b'], ['ncloc'])
+    assert [2, 2] == [len(histories[key]) for key in ('a', 'b')]
+    refreshed = sq.measures_history(['a'], ['ncloc'], previous=histories)
+    assert refreshed['a'] is histories['a']
+    assert 3 == len(histories['a'])
+
+
+@httpretty.activate
+def test_gate_statuses_queries_every_project():
+    def status(request, uri, headers):
+        key = request.querystring['projectKey'][0]
+        return [200, headers, json.dumps({'projectStatus': {'status': 'OK' if key == 'a' else 'ERROR'}})]
+    httpretty.register_uri(httpretty.GET, 'http://localhost:9000/api/qualitygates/project_status', body=status)
+    statuses = SonarQube().gate_statuses(['a', 'b', 'c'], workers=3)
+    assert {'a': 'OK', 'b': 'ERROR', 'c': 'ERROR'} == {key: s['status'] for key, s in statuses.items()}
+
+
+@httpretty.activate
+def test_wait_for_gates_yields_tasks_as_they_finish():
+    polls = {'fast': ['SUCCESS'], 'slow': ['PENDING', 'IN_PROGRESS', 'SUCCESS'], 'broken': ['FAILED']}
+
+    def task(request, uri, headers):
+        task_id = request.querystring['id'][0]
+        status = polls[task_id].pop(0)
+        return [200, headers, json.dumps({'task': {'id': task_id, 'status': status, 'analysisId': task_id + '-analysis'}})]
+    httpretty.register_uri(httpretty.GET, 'http://localhost:9000/api/ce/task', body=task)
+    httpretty.register_uri(httpretty.GET, 'http://localhost:9000/api/qualitygates/project_status',
+                           body='{"projectStatus":{"status":"OK"}}')
+
+    done = [(t['id'], s and s['status']) for t, s in
+            SonarQube().wait_for_gates(['slow', 'fast', 'broken'], initial_delay=0.01, timeout=5)]
+    assert {('fast', 'OK'), ('broken', None)} == set(done[:2])
+    assert ('slow', 'OK') == done[2]
+
+
+@httpretty.activate
+def test_wait_for_gates_times_out():
+    httpretty.register_uri(httpretty.GET, 'http://localhost:9000/api/ce/task',
+                           body='{"task":{"id":"t","status":"PENDING"}}')
+    with pytest.raises(TimeoutError):
+        list(SonarQube().wait_for_gates(['t'], initial_delay=0.05, timeout=0.1))
+
+
 @httpretty.activate
 def test_post_returns_response():
     httpretty.register_uri(httpretty.POST, 'http://localhost:9000/endpoint',
                            body='{"hello":"world"}')
     assert 'world' == SonarQube().post(Endpoint('/endpoint'))['hello']
 
+
+@httpretty.activate
+def test_empty_response_has_no_item():
+    httpretty.register_uri(httpretty.POST, 'http://localhost:9000/endpoint', body='', status=204)
+    assert SonarQube().post(Endpoint('/endpoint', response_item='profiles')) is None
+
 def __paged_response(page_index=1, page_size=1, total=1):
     return json.dumps(
         {
@@ -113,3 +330,86 @@ def __paged_response(page_index=1, page_size=1, total=1):
             'items': [{'hello': 'world'}]
         }
     )
+
+
+def __paged_callback(total):
+    def callback(request, uri, headers):
+        page_index = int(request.querystring.get('p', ['1'])[0])
+        page_size = int(request.querystring.get('ps', ['100'])[0])
+        first = (page_index - 1) * page_size
+        items = [{'n': n + 1} for n in range(first, min(first + page_size, total))]
+        body = {
+            'paging': {'pageIndex': page_index, 'pageSize': page_size, 'total': total},
+            'items': items
+        }
+        return [200, headers, json.dumps(body)]
+    return callback
+
+
+def __issues_callback(count, cap=3, hours_apart=1):
+    # unresolved code smells created hours_apart, filtered and capped like /api/issues/search
+    start = datetime(2022, 1, 1, tzinfo=timezone.utc)
+    issues = [{'key': 'issue-{}'.format(n), 'rule': 'r{}'.format(n % 10), 'severity': 'MAJOR', 'type': 'CODE_SMELL',
+               'resolved': 'false',
+               'creationDate': (start + timedelta(hours=n * hours_apart)).strftime('%Y-%m-%dT%H:%M:%S%z')}
+              for n in range(count)]
+    fields = {'rules': 'rule', 'severities': 'severity', 'types': 'type', 'resolved': 'resolved'}
+
+    def parse(value):
+        # httpretty decodes the '+' of the utc offset as a space
+        return datetime.strptime(value.replace(' ', '+'), '%Y-%m-%dT%H:%M:%S%z')
+
+    def callback(request, uri, headers):
+        qs = {k: v[0] for k, v in request.querystring.items()}
+        matched = [i for i in issues
+                   if ('createdAfter' not in qs or parse(i['creationDate']) >= parse(qs['createdAfter']))
+                   and ('createdBefore' not in qs or parse(i['creationDate']) < parse(qs['createdBefore']))
+                   and all(qs.get(param, i[field]) == i[field] for param, field in fields.items())]
+        page_index, page_size = int(qs.get('p', 1)), int(qs.get('ps', 100))
+        first = (page_index - 1) * page_size
+        body = {
+            'paging': {'pageIndex': page_index, 'pageSize': page_size, 'total': len(matched)},
+            'issues': matched[:cap][first:first + page_size]
+        }
+        if 'facets' in qs:
+            counts = {}
+            for issue in matched:
+                value = issue[fields[qs['facets']]]
+                counts[value] = counts.get(value, 0) + 1
+            body['facets'] = [{'property': qs['facets'], 'values': [{'val': v, 'count': c} for v, c in counts.items()]}]
+        return [200, headers, json.dumps(body)]
+    return callback
+
+
+@httpretty.activate
+def test_requests_ask_for_compressed_responses():
+
+    httpretty.register_uri(httpretty.GET, 'http://localhost:9000/endpoint', body='{}')
+    SonarQube().get(Endpoint('/endpoint'))
+    assert httpretty.last_request().headers['Accept-Encoding'] == 'gzip, deflate'
+    assert httpretty.last_request().headers['Connection'] == 'keep-alive'
+
+    SonarQube(compress=False, keep_alive=False).get(Endpoint('/endpoint'))
+    assert httpretty.last_request().headers['Accept-Encoding'] == 'identity'
+    assert httpretty.last_request().headers['Connection'] == 'close'
+
+
+def test_thread_safe_sessions_share_connection_pool():
+    from concurrent.futures import ThreadPoolExecutor
+    sq = SonarQube(token='secret', thread_safe=True, page_workers=50)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        other = executor.submit(lambda: sq._session).result()
+    assert sq._adapter._pool_maxsize == 50
+    assert sq._session is sq._session
+    assert other is not sq._session
+    for session in (sq._session, other):
+        assert session.get_adapter('http://localhost:9000') is sq._adapter
+        assert session.auth == ('secret', '')
+
+
+def test_thread_pool_workers_get_their_own_session():
+    sq = SonarQube(token='secret')
+    with sq.thread_pool(2) as executor:
+        sessions = set(executor.map(lambda _: sq._session, range(4)))
+    assert sq._session not in sessions
+    assert all(session.get_adapter('http://localhost:9000') is sq._adapter for session in sessions)
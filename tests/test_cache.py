@@ -0,0 +1,140 @@
+import pytest
+import httpretty
+import time
+from sonarqube.api import SonarQube, Endpoint
+from sonarqube.cache import MemoryCache, DiskCache, CacheEntry, SingleFlight
+
+RULE_URL = 'http://localhost:9000/api/rules/show'
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = MemoryCache(maxsize=2)
+    cache.set('/a?', CacheEntry(1, 0))
+    cache.set('/b?', CacheEntry(2, 0))
+    cache.get('/a?')
+    cache.set('/c?', CacheEntry(3, 0))
+    assert cache.get('/b?') is None
+    assert 1 == cache.get('/a?').value
+
+
+def test_disk_cache_is_shared_between_instances(tmp_path):
+    filename = str(tmp_path / 'cache.db')
+    DiskCache(filename).set('/api/rules/show?key=a', CacheEntry({'rule': 'a'}, time.time() + 60, etag='"v1"'))
+    entry = DiskCache(filename).get('/api/rules/show?key=a')
+    assert {'rule': 'a'} == entry.value
+    assert '"v1"' == entry.etag
+    DiskCache(filename).invalidate('/api/rules/show')
+    assert DiskCache(filename).get('/api/rules/show?key=a') is None
+
+
+def test_disk_cache_evicts_least_recently_used_in_batches(tmp_path, monkeypatch):
+    clock = iter(range(1000))
+    monkeypatch.setattr('sonarqube.cache.time.time', lambda: next(clock) * 100)
+    cache = DiskCache(str(tmp_path / 'cache.db'), maxsize=10)
+    for n in range(10):
+        cache.set(f'/{n}?', CacheEntry(n, 0))
+    cache.get('/0?')
+    cache.set('/10?', CacheEntry(10, 0))
+    # one over maxsize, a tenth more evicted with it
+    assert [0] + list(range(3, 11)) == [n for n in range(11) if cache.get(f'/{n}?') is not None]
+
+
+@httpretty.activate
+def test_cached_get_is_served_from_cache():
+    httpretty.register_uri(httpretty.GET, RULE_URL, body='{"rule":{"key":"a"}}')
+    sq = SonarQube(cache=MemoryCache())
+    assert sq.get_rule(key='a') == sq.get_rule(key='a')
+    assert 1 == len(httpretty.latest_requests())
+    assert {'hits': 1, 'misses': 1, 'revalidations': 0, 'invalidations': 0} == sq.cache.stats.as_dict()
+
+
+@httpretty.activate
+def test_expired_entry_is_revalidated_with_etag():
+    def callback(request, uri, headers):
+        if request.headers.get('If-None-Match') == '"v1"':
+            return [304, headers, '']
+        return [200, dict(headers, ETag='"v1"'), '{"rule":{"key":"a"}}']
+    httpretty.register_uri(httpretty.GET, RULE_URL, body=callback)
+    sq = SonarQube(cache=MemoryCache())
+    endpoint = Endpoint('/api/rules/show', response_item='rule', cache_ttl=-1)
+    sq.get(endpoint, key='a')
+    assert 'a' == sq.get(endpoint, key='a')['key']
+    assert 1 == sq.cache.stats.revalidations
+
+
+@httpretty.activate
+def test_post_invalidates_related_entries():
+    httpretty.register_uri(httpretty.GET, 'http://localhost:9000/api/qualitygates/get_by_project',
+                           body='{"qualityGate":{"name":"Sonar way"}}')
+    httpretty.register_uri(httpretty.POST, 'http://localhost:9000/api/qualitygates/select', body='')
+    sq = SonarQube(cache=MemoryCache())
+    sq.get_qualitygates_get_by_project(project='p')
+    sq.post_qualitygates_select(gateName='Other', projectKey='p')
+    sq.get_qualitygates_get_by_project(project='p')
+    assert 2 == sq.cache.stats.misses
+
+
+@httpretty.activate
+def test_cache_is_scoped_to_server_and_credentials():
+    httpretty.register_uri(httpretty.GET, RULE_URL, body='{"rule":{"key":"a"}}')
+    httpretty.register_uri(httpretty.GET, 'http://other:9000/api/rules/show', body='{"rule":{"key":"a"}}')
+    cache = MemoryCache()
+    for sq in (SonarQube(token='one', cache=cache), SonarQube(token='two', cache=cache),
+               SonarQube(host='http://other', token='one', cache=cache), SonarQube(token='one', cache=cache)):
+        sq.get_rule(key='a')
+    assert 3 == len(httpretty.latest_requests())
+    assert {'hits': 1, 'misses': 3} == {name: cache.stats.as_dict()[name] for name in ('hits', 'misses')}
+
+
+@httpretty.activate
+def test_post_invalidates_entries_of_its_own_scope():
+    httpretty.register_uri(httpretty.GET, 'http://localhost:9000/api/qualitygates/get_by_project',
+                           body='{"qualityGate":{"name":"Sonar way"}}')
+    httpretty.register_uri(httpretty.POST, 'http://localhost:9000/api/qualitygates/select', body='')
+    cache = DiskCache(':memory:')
+    sq = SonarQube(token='one', cache=cache)
+    sq.get_qualitygates_get_by_project(project='p')
+    sq.post_qualitygates_select(gateName='Other', projectKey='p')
+    sq.get_qualitygates_get_by_project(project='p')
+    assert 2 == cache.stats.misses
+
+
+def __wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+@httpretty.activate
+def test_concurrent_identical_gets_are_coalesced():
+    from concurrent.futures import ThreadPoolExecutor
+    sq = SonarQube(coalesce=True)
+
+    def callback(request, uri, headers):
+        # hold the first request until the others have joined it
+        __wait_for(lambda: sq.flights.saved == 3)
+        return [200, headers, '{"rule":{"key":"a"}}']
+    httpretty.register_uri(httpretty.GET, RULE_URL, body=callback)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        rules = list(executor.map(lambda _: sq.get_rule(key='a'), range(4)))
+    assert [{'key': 'a'}] * 4 == rules
+    assert 1 == len(httpretty.latest_requests())
+    assert {'calls': 1, 'saved': 3} == sq.flights.as_dict()
+
+
+def test_coalesced_callers_get_the_leaders_exception():
+    from concurrent.futures import ThreadPoolExecutor
+    flights = SingleFlight()
+
+    def fail():
+        __wait_for(lambda: flights.saved == 1)
+        raise ValueError('boom')
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [executor.submit(flights.do, 'key', fail) for _ in range(2)]
+        for future in futures:
+            with pytest.raises(ValueError):
+                future.result()
+    # nothing left in flight, the next call is made again
+    assert 'again' == flights.do('key', lambda: 'again')
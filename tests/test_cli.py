@@ -0,0 +1,107 @@
+import pytest
+from click.testing import CliRunner
+from requests import Response
+from sonarqube.cli import cli
+from sonarqube.community import Project
+from sonarqube.exceptions import ClientError, ServerError
+from requests.exceptions import HTTPError
+
+MANIFEST = """
+projects:
+  - key: module-a
+    name: module-a
+    quality-gate: "Sonar way"
+  - key: module-b
+    name: module-b
+    suffix: release
+"""
+
+
+def __error(error, status_code):
+    response = Response()
+    response.status_code = status_code
+    return error(HTTPError(response=response))
+
+
+def test_create_processes_every_project_in_manifest(tmp_path, mocker):
+    config = tmp_path / 'sonarqube.yml'
+    config.write_text(MANIFEST)
+    created = []
+    mocker.patch.object(Project, 'create_or_update', autospec=True,
+                        side_effect=lambda project: created.append(project.full_key))
+
+    result = CliRunner().invoke(cli, ['-c', str(config), '-s', 'feature/x', 'create'])
+
+    assert 0 == result.exit_code
+    assert ['module-a:feature-x', 'module-b:release'] == sorted(created)
+
+
+def test_failures_are_aggregated_into_highest_exit_code(tmp_path, mocker):
+    config = tmp_path / 'sonarqube.yml'
+    config.write_text(MANIFEST)
+    errors = {'module-a': __error(ClientError, 404), 'module-b:release': __error(ServerError, 503)}
+
+    def delete(project):
+        raise errors[project.full_key]
+    mocker.patch.object(Project, 'delete', autospec=True, side_effect=delete)
+
+    result = CliRunner().invoke(cli, ['-c', str(config), '-j', '2', 'delete'])
+
+    assert 5 == result.exit_code
+
+
+def test_profile_prints_request_metrics(tmp_path, mocker):
+    config = tmp_path / 'sonarqube.yml'
+    config.write_text(MANIFEST)
+    mocker.patch.object(Project, 'create_or_update', autospec=True)
+
+    result = CliRunner().invoke(cli, ['-c', str(config), '--profile', 'create'])
+
+    assert 0 == result.exit_code
+    assert 'requests' in result.stderr
+
+
+def test_help_needs_no_config_or_client(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    result = CliRunner().invoke(cli, ['create', '--help'])
+    assert 0 == result.exit_code
+
+
+def test_batch_runs_every_operation_over_one_client(tmp_path, mocker):
+    config = tmp_path / 'sonarqube.yml'
+    config.write_text(MANIFEST)
+    calls = []
+    mocker.patch.object(Project, 'create_or_update', autospec=True,
+                        side_effect=lambda project: calls.append(('create', project.full_key, id(project.sq))))
+    mocker.patch.object(Project, 'delete', autospec=True,
+                        side_effect=lambda project: calls.append(('delete', project.full_key, id(project.sq))))
+    operations = f"""
+# comments and blank lines are skipped
+-c {config} -s feature/x create
+-c {config} delete
+unknown
+"""
+
+    result = CliRunner().invoke(cli, ['batch'], input=operations)
+
+    assert 2 == result.exit_code
+    assert [('create', 'module-a:feature-x'), ('create', 'module-b:release'),
+            ('delete', 'module-a'), ('delete', 'module-b:release')] == sorted(call[:2] for call in calls)
+    assert 1 == len({call[2] for call in calls})
+
+
+def test_index_is_opt_in_and_shared_by_a_batch(tmp_path, mocker):
+    config = tmp_path / 'sonarqube.yml'
+    config.write_text(MANIFEST)
+    indexes = []
+    mocker.patch.object(Project, 'create_or_update', autospec=True,
+                        side_effect=lambda project: indexes.append(project.index))
+    operations = f"-c {config} create\n-c {config} -s feature/x create\n"
+
+    assert 0 == CliRunner().invoke(cli, ['-c', str(config), 'create']).exit_code
+    assert [None, None] == indexes
+
+    indexes.clear()
+    assert 0 == CliRunner().invoke(cli, ['--index', 'batch'], input=operations).exit_code
+    assert 4 == len(indexes)
+    assert 1 == len({id(index) for index in indexes}) and indexes[0] is not None
@@ -2,7 +2,7 @@ import pytest
 import json
 import httpretty
 from sonarqube.api import SonarQube
-from sonarqube.community import Project
+from sonarqube.community import Project, ProjectIndex
 
 def test_no_suffix_name():
     
@@ -13,4 +13,154 @@ def test_no_suffix_name():
     # project.create_or_update()
     
     # then
-    assert project
\ No newline at end of file
+    assert project
+
+@httpretty.activate
+def test_create_or_update_only_sends_changed_assignments():
+
+    # given
+    __register(httpretty.GET, '/api/projects/search',
+               {'paging': {'pageIndex': 1, 'pageSize': 100, 'total': 1}, 'components': [{'key': 'my-project'}]})
+    __register(httpretty.GET, '/api/qualitygates/get_by_project', {'qualityGate': {'name': 'Sonar way'}})
+    __register(httpretty.GET, '/api/qualityprofiles/search',
+               {'profiles': [{'language': 'py', 'name': 'Sonar way'}, {'language': 'java', 'name': 'Sonar way'}]})
+    __register(httpretty.POST, '/api/qualityprofiles/add_project', {})
+    project = Project(key='my-project', name='my-project', quality_gate='Sonar way',
+                      quality_profiles={'py': 'Sonar way', 'java': 'Strict'}, sq=SonarQube())
+
+    # when
+    actions = project.create_or_update()
+
+    # then
+    assert ['quality-profile:java'] == actions
+    posts = [r for r in httpretty.latest_requests() if r.method == 'POST']
+    assert 1 == len(posts)
+    assert ['Strict'] == posts[0].querystring['qualityProfile']
+
+
+@httpretty.activate
+def test_create_or_update_creates_missing_project():
+
+    # given
+    __register(httpretty.GET, '/api/projects/search',
+               {'paging': {'pageIndex': 1, 'pageSize': 100, 'total': 0}, 'components': []})
+    __register(httpretty.POST, '/api/projects/create', {'project': {'key': 'my-project:branch'}})
+    __register(httpretty.GET, '/api/qualitygates/get_by_project', {'qualityGate': {'name': 'Sonar way'}})
+    __register(httpretty.POST, '/api/qualitygates/select', {})
+    project = Project(key='my-project', name='my-project', suffix='branch', quality_gate='Strict', sq=SonarQube())
+
+    # when
+    actions = project.create_or_update()
+
+    # then
+    assert ['create', 'quality-gate'] == actions
+    assert {'key': 'my-project:branch'} == project.sq_project
+    assert not [r for r in httpretty.latest_requests() if r.path.startswith('/api/qualitygates/get_by_project')]
+
+
+@httpretty.activate
+def test_create_or_update_assigns_defaults_explicitly():
+
+    # given
+    __register(httpretty.GET, '/api/projects/search',
+               {'paging': {'pageIndex': 1, 'pageSize': 100, 'total': 1}, 'components': [{'key': 'my-project'}]})
+    __register(httpretty.GET, '/api/qualitygates/get_by_project',
+               {'qualityGate': {'name': 'Sonar way', 'default': True}})
+    __register(httpretty.GET, '/api/qualityprofiles/search',
+               {'profiles': [{'language': 'py', 'name': 'Sonar way', 'isDefault': True}]})
+    __register(httpretty.POST, '/api/qualitygates/select', {})
+    __register(httpretty.POST, '/api/qualityprofiles/add_project', {})
+    project = Project(key='my-project', name='my-project', quality_gate='Sonar way',
+                      quality_profiles={'py': 'Sonar way'}, sq=SonarQube())
+
+    # when
+    actions = project.create_or_update()
+
+    # then
+    assert ['quality-gate', 'quality-profile:py'] == actions
+
+
+@httpretty.activate
+def test_prune_bulk_deletes_stale_branch_projects(monkeypatch):
+
+    # given
+    monkeypatch.setattr(Project, 'BULK_DELETE_BATCH_SIZE', 2)
+    keys = ['my-project', 'my-project:main', 'my-project:feature-a', 'my-project:feature-b', 'my-project:old',
+            'my-project-other:x']
+    __register(httpretty.GET, '/api/projects/search',
+               {'paging': {'pageIndex': 1, 'pageSize': 100, 'total': len(keys)}, 'components': [{'key': k} for k in keys]})
+    __register(httpretty.POST, '/api/projects/bulk_delete', {})
+    project = Project(key='my-project', name='my-project', suffix='main', sq=SonarQube())
+
+    # when
+    pruned = project.prune(keep=['feature/a'])
+
+    # then
+    assert ['my-project:feature-b', 'my-project:old'] == pruned
+    posts = [r for r in httpretty.latest_requests() if r.method == 'POST']
+    assert [['my-project:feature-b,my-project:old']] == [r.querystring['projects'] for r in posts]
+
+
+def test_prune_dry_run_deletes_nothing(mocker):
+
+    # given
+    sq = mocker.Mock()
+    sq.get_projects_search.return_value = iter([{'key': 'my-project:old'}])
+    project = Project(key='my-project', name='my-project', sq=sq)
+
+    # when
+    pruned = project.prune(analyzed_before='2022-01-01', dry_run=True)
+
+    # then
+    assert ['my-project:old'] == pruned
+    sq.get_projects_search.assert_called_once_with(q='my-project', analyzedBefore='2022-01-01')
+    sq.post_projects_bulk_delete.assert_not_called()
+
+
+@httpretty.activate
+def test_project_index_resolves_projects_without_searching():
+
+    # given
+    keys = ['a', 'my-project', 'my-project:main', 'my-project:old', 'my-project-other']
+    __register(httpretty.GET, '/api/projects/search',
+               {'paging': {'pageIndex': 1, 'pageSize': 500, 'total': len(keys)}, 'components': [{'key': k} for k in keys]})
+    __register(httpretty.POST, '/api/projects/delete', {})
+    sq = SonarQube()
+    index = ProjectIndex(sq)
+
+    # when
+    Project(key='my-project', name='my-project', suffix='old', sq=sq, index=index).delete()
+    main = Project(key='my-project', name='my-project', suffix='main', sq=sq, index=index)
+    main.read()
+
+    # then
+    assert {'key': 'my-project:main'} == main.sq_project
+    assert [{'key': 'my-project:main'}] == index.with_prefix('my-project:')
+    assert 1 == len([r for r in httpretty.latest_requests() if r.method == 'GET'])
+
+
+def test_partial_project_index_searches_keys_it_misses(mocker, monkeypatch):
+
+    # given
+    monkeypatch.setattr(SonarQube.PROJECTS_ENDPOINT.pager, 'max_results', 2)
+    sq = mocker.Mock()
+    def search(**args):
+        if ('projects' in args):
+            return iter([{'key': args['projects']}] if args['projects'] == 'p11000' else [])
+        return iter([{'key': 'p0'}, {'key': 'p1'}])
+    sq.get_projects_search.side_effect = search
+    index = ProjectIndex(sq)
+
+    # when
+    project = Project(key='p11000', name='p11000', sq=sq, index=index)
+    project.read()
+
+    # then
+    assert index.partial
+    assert {'key': 'p11000'} == project.sq_project
+    assert 'p11000' in index
+    assert 'p99999' not in index
+
+
+def __register(method, path, body):
+    httpretty.register_uri(method, 'http://localhost:9000' + path, body=json.dumps(body))
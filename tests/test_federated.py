@@ -0,0 +1,41 @@
+import json
+import httpretty
+from sonarqube.exceptions import ServerError
+from sonarqube.federated import FederatedSonarQube
+
+
+def __projects(keys):
+    return json.dumps({'paging': {'pageIndex': 1, 'pageSize': 100, 'total': len(keys)},
+                       'components': [{'key': key} for key in keys]})
+
+
+@httpretty.activate
+def test_results_of_every_instance_are_merged_and_tagged():
+    httpretty.register_uri(httpretty.GET, 'http://emea:9000/api/projects/search', body=__projects(['a', 'b']))
+    httpretty.register_uri(httpretty.GET, 'http://apac:9000/api/projects/search', body=__projects(['c']))
+    federation = FederatedSonarQube({'emea': {'host': 'http://emea'}, 'apac': {'host': 'http://apac'}})
+
+    projects = sorted((name, project['key']) for name, project in federation.get_projects_search())
+
+    assert [('apac', 'c'), ('emea', 'a'), ('emea', 'b')] == projects
+    assert {} == federation.errors
+
+
+@httpretty.activate
+def test_failing_instance_is_isolated():
+    httpretty.register_uri(httpretty.GET, 'http://emea:9000/api/projects/search', body=__projects(['a']))
+    httpretty.register_uri(httpretty.GET, 'http://apac:9000/api/projects/search', status=500, body='')
+    federation = FederatedSonarQube({'emea': {'host': 'http://emea'}, 'apac': {'host': 'http://apac'}})
+
+    assert [('emea', 'a')] == [(name, project['key']) for name, project in federation.get_projects_search()]
+    assert ['apac'] == list(federation.errors)
+    assert isinstance(federation.errors['apac'], ServerError)
+
+
+@httpretty.activate
+def test_stopping_early_ends_the_queries():
+    httpretty.register_uri(httpretty.GET, 'http://emea:9000/api/projects/search', body=__projects(['a', 'b']))
+    federation = FederatedSonarQube({'emea': {'host': 'http://emea'}})
+    results = federation.get_projects_search()
+    assert 'emea' == next(results)[0]
+    results.close()
@@ -0,0 +1,47 @@
+import pytest
+import json
+import httpretty
+from sonarqube.api import SonarQube, Endpoint
+from sonarqube.exceptions import ServerError
+from sonarqube.metrics import Metrics
+
+PROJECTS_URL = 'http://localhost:9000/api/projects/search'
+
+
+def __pages(request, uri, headers):
+    page = int(request.querystring.get('p', ['1'])[0])
+    body = {'paging': {'pageIndex': page, 'pageSize': 2, 'total': 3},
+            'components': [{'key': f'p{i}'} for i in range(2 * page - 2, min(2 * page, 3))]}
+    return [200, headers, json.dumps(body)]
+
+
+@httpretty.activate
+def test_paged_get_records_requests_and_pages():
+    httpretty.register_uri(httpretty.GET, PROJECTS_URL, body=__pages)
+    metrics = Metrics()
+    sq = SonarQube(metrics=metrics)
+
+    assert 3 == len(list(sq.get_projects_search(ps=2)))
+
+    recorded = metrics.as_dict()['/api/projects/search']
+    assert 2 == recorded['requests']
+    assert 2 == recorded['pages']
+    assert 3 == recorded['items']
+    assert 0 == recorded['errors']
+    assert recorded['bytes'] > 0
+    assert 2 == sum(recorded['latency_buckets'])
+
+
+@httpretty.activate
+def test_errors_are_counted_and_exported():
+    httpretty.register_uri(httpretty.GET, 'http://localhost:9000/endpoint', status=500, body='')
+    metrics = Metrics()
+    with pytest.raises(ServerError):
+        SonarQube(metrics=metrics).get(Endpoint('/endpoint'))
+
+    assert 1 == json.loads(metrics.to_json())['endpoints']['/endpoint']['errors']
+    prometheus = metrics.to_prometheus()
+    assert 'sonarqube_errors_total{endpoint="/endpoint"} 1' in prometheus
+    assert 'sonarqube_request_seconds_bucket{endpoint="/endpoint",le="+Inf"} 1' in prometheus
+    assert 'sonarqube_request_seconds_count{endpoint="/endpoint"} 1' in prometheus
+    assert '/endpoint' in metrics.summary()
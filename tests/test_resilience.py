@@ -0,0 +1,110 @@
+import pytest
+import httpretty
+import requests
+import time
+from sonarqube.api import SonarQube, Endpoint
+from sonarqube.exceptions import ClientError
+from sonarqube.resilience import RetryPolicy, RateLimiter, AdaptiveLimiter
+
+
+@httpretty.activate
+def test_get_is_retried_after_throttling():
+    httpretty.register_uri(httpretty.GET, 'http://localhost:9000/endpoint',
+                           responses=[httpretty.Response(body='', status=429, adding_headers={'Retry-After': '0'}),
+                                      httpretty.Response(body='', status=503),
+                                      httpretty.Response(body='{"hello":"world"}')])
+    limiter = AdaptiveLimiter(initial=4)
+    sq = SonarQube(retry=RetryPolicy(backoff=0.01), limiter=limiter)
+    assert 'world' == sq.get(Endpoint('/endpoint'))['hello']
+    assert limiter.limit < 4
+
+
+@httpretty.activate
+def test_request_is_in_flight_until_its_body_is_decoded():
+    httpretty.register_uri(httpretty.GET, 'http://localhost:9000/endpoint', body='{"hello":"world"}')
+    limiter = AdaptiveLimiter(initial=4)
+    in_flight = []
+
+    def decode(content):
+        in_flight.append(limiter._in_flight)
+        return {'hello': 'world'}
+
+    sq = SonarQube(limiter=limiter, json_decoder=decode)
+    assert 'world' == sq.get(Endpoint('/endpoint'))['hello']
+    assert [1] == in_flight
+    assert 0 == limiter._in_flight
+
+
+def test_connection_errors_count_as_congestion():
+    def get(url, **kwargs):
+        raise requests.ConnectionError('Connection refused')
+
+    limiter = AdaptiveLimiter(initial=4)
+    sq = SonarQube(limiter=limiter)
+    with pytest.raises(requests.ConnectionError):
+        sq.call(get, Endpoint('/endpoint'))
+    assert limiter.limit < 4
+    assert 0 == limiter._in_flight
+
+
+@httpretty.activate
+def test_retries_give_up_with_original_error():
+    httpretty.register_uri(httpretty.GET, 'http://localhost:9000/endpoint', status=429, body='')
+    with pytest.raises(ClientError):
+        SonarQube(retry=RetryPolicy(retries=2, backoff=0.01)).get(Endpoint('/endpoint'))
+    assert 3 == len(httpretty.latest_requests())
+
+
+@httpretty.activate
+def test_post_is_not_retried():
+    httpretty.register_uri(httpretty.POST, 'http://localhost:9000/endpoint', status=503, body='')
+    with pytest.raises(Exception):
+        SonarQube(retry=RetryPolicy(backoff=0.01)).post(Endpoint('/endpoint'))
+    assert 1 == len(httpretty.latest_requests())
+
+
+def test_rate_limiter_spaces_requests_past_burst():
+    limiter = RateLimiter(rate=50, burst=2)
+    start = time.monotonic()
+    for _ in range(7):
+        limiter.acquire()
+    assert time.monotonic() - start >= 0.09
+
+
+def test_adaptive_limiter_increases_additively_and_decreases_multiplicatively():
+    limiter = AdaptiveLimiter(initial=4, max_limit=8)
+    for _ in range(4):
+        limiter.acquire()
+        limiter.release()
+    assert 4.9 < limiter.limit < 5.1
+    limiter.acquire()
+    limiter.release(throttled=True)
+    assert limiter.limit < 2.6
+
+
+def test_adaptive_limiter_decreases_once_per_window():
+    limiter = AdaptiveLimiter(initial=8)
+    windows = [limiter.acquire() for _ in range(8)]
+    for window in windows:
+        limiter.release(True, window)
+    assert 4 == limiter.limit
+    # sent after the decrease, a new window
+    limiter.release(True, limiter.acquire())
+    assert 2 == limiter.limit
+
+
+def test_retry_after_is_honoured_past_max_backoff():
+    res = requests.Response()
+    res.headers['Retry-After'] = '120'
+    assert 120 == RetryPolicy(max_backoff=30).delay(0, res)
+
+
+@httpretty.activate
+def test_retried_bad_gateway_counts_as_congestion():
+    httpretty.register_uri(httpretty.GET, 'http://localhost:9000/endpoint',
+                           responses=[httpretty.Response(body='', status=502),
+                                      httpretty.Response(body='{"hello":"world"}')])
+    limiter = AdaptiveLimiter(initial=4)
+    sq = SonarQube(retry=RetryPolicy(backoff=0.01), limiter=limiter)
+    assert 'world' == sq.get(Endpoint('/endpoint'))['hello']
+    assert limiter.limit < 4
@@ -0,0 +1,46 @@
+import pytest
+import json
+import httpretty
+from sonarqube.api import SonarQube, Endpoint, Pager
+from sonarqube.stream import StreamedPage
+
+PAGE = {
+    'total': 12345,
+    'paging': {'pageIndex': 1, 'pageSize': 3, 'total': 12345},
+    'issues': [{'key': 'a', 'line': 10}, {'key': 'b', 'message': 'café ☃'}, {'key': 'c', 'flows': [[1], []]}],
+    'facets': []
+}
+
+
+def __chunks(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize('size', [1, 2, 7, 1024])
+def test_items_and_fields_are_parsed_across_chunks(size):
+    page = StreamedPage(__chunks(json.dumps(PAGE, ensure_ascii=False, indent=1).encode('utf-8'), size), 'issues')
+    assert PAGE['issues'] == list(page)
+    assert {'total': 12345, 'paging': PAGE['paging'], 'facets': []} == page.fields
+
+
+def test_items_are_yielded_before_the_page_is_read():
+    def chunks():
+        yield b'{"paging": {"total": 2}, "issues": [{"key": "a"},'
+        raise AssertionError('read too far')
+    assert {'key': 'a'} == next(iter(StreamedPage(chunks(), 'issues')))
+
+
+def test_truncated_response_raises():
+    with pytest.raises(ValueError):
+        list(StreamedPage([b'{"issues": [{"key": "a"}'], 'issues'))
+
+
+@httpretty.activate
+def test_streaming_paged_get_returns_multiple_pages():
+    for page_index in (1, 2):
+        httpretty.register_uri(httpretty.GET, 'http://localhost:9000/endpoint' + ('?p=2' if page_index == 2 else ''),
+                               match_querystring=True,
+                               body=json.dumps({'paging': {'pageIndex': page_index, 'pageSize': 1, 'total': 2},
+                                                'items': [{'n': page_index}]}))
+    generator = SonarQube(streaming=True).paged_get(Endpoint('/endpoint', pager=Pager(response_items='items')))
+    assert [1, 2] == [item['n'] for item in generator]
@@ -0,0 +1,49 @@
+import pytest
+import json
+import httpretty
+from sonarqube.api import SonarQube
+from sonarqube.sync import IssueSync
+
+ISSUES_URL = 'http://localhost:9000/api/issues/search'
+
+
+def __issue(key, updated, status='OPEN'):
+    return {'key': key, 'project': 'p', 'rule': 'py:S1', 'severity': 'MAJOR', 'status': status,
+            'creationDate': '2022-01-01T00:00:00+0000', 'updateDate': updated}
+
+
+def __serve(issues):
+    def callback(request, uri, headers):
+        matched = list(issues)
+        if request.querystring.get('s') == ['UPDATE_DATE']:
+            matched.sort(key=lambda i: i['updateDate'], reverse=True)
+        page_index, page_size = int(request.querystring.get('p', ['1'])[0]), int(request.querystring.get('ps', ['100'])[0])
+        body = {'paging': {'pageIndex': page_index, 'pageSize': page_size, 'total': len(matched)},
+                'issues': matched[(page_index - 1) * page_size:page_index * page_size]}
+        return [200, headers, json.dumps(body)]
+    httpretty.register_uri(httpretty.GET, ISSUES_URL, body=callback)
+
+
+@httpretty.activate
+def test_sync_fetches_only_updated_issues(tmp_path):
+    issues = [__issue('a', '2022-01-02T00:00:00+0000'), __issue('b', '2022-01-03T00:00:00+0000')]
+    __serve(issues)
+    sync = IssueSync(SonarQube(), str(tmp_path / 'issues.db'))
+    assert {'p': 2} == sync.sync(projects=['p'])
+
+    issues[0] = __issue('a', '2022-01-05T00:00:00+0000', status='CLOSED')
+    # 'a' changed, 'b' is at the watermark and fetched again
+    assert {'p': 2} == sync.sync(projects=['p'])
+    assert [('a', 'CLOSED'), ('b', 'OPEN')] == sync.db.execute('SELECT key, status FROM issues ORDER BY key').fetchall()
+    assert ('2022-01-05T00:00:00+0000',) == sync.db.execute('SELECT watermark FROM projects').fetchone()
+
+
+@httpretty.activate
+def test_interrupted_run_is_resumed(tmp_path):
+    __serve([__issue('a', '2022-01-02T00:00:00+0000')])
+    sync = IssueSync(SonarQube(), str(tmp_path / 'issues.db'))
+    run = sync._run()
+    sync.sync_project('p1', run)
+
+    assert ['p2'] == list(sync.sync(projects=['p1', 'p2']))
+    assert sync._run() != run
@@ -0,0 +1,62 @@
+import pytest
+import math
+from sonarqube.table import IssueTable, MeasureHistory, MeasureMatrix, MISSING
+
+
+ISSUES = [
+    {'key': 'a', 'rule': 'py:S1', 'severity': 'MAJOR', 'type': 'BUG', 'line': 3, 'effort': '1h5min',
+     'creationDate': '2022-01-01T01:00:00+0100', 'message': 'one'},
+    {'key': 'b', 'rule': 'py:S2', 'severity': 'MINOR', 'type': 'CODE_SMELL', 'effort': '1d',
+     'creationDate': '2022-01-01T00:00:00+0000'},
+    {'key': 'c', 'rule': 'py:S1', 'severity': 'MAJOR', 'type': 'CODE_SMELL', 'line': 7},
+]
+
+
+def test_columns_are_parsed():
+    table = IssueTable.from_issues(ISSUES)
+    assert 3 == len(table)
+    assert [3, MISSING, 7] == list(table.column('line'))
+    assert [65, 480, MISSING] == list(table.column('effort'))
+    assert [1640995200, 1640995200, MISSING] == list(table.column('creation_date'))
+    assert ['py:S1', 'py:S2'] == table.categories('rule')
+    assert 'MINOR' == table[1].severity
+    assert 'c' == table[-1].key
+
+
+def test_where_combines_conditions():
+    table = IssueTable.from_issues(ISSUES)
+    assert ['a', 'c'] == [row.key for row in table.where(rule='py:S1')]
+    assert ['c'] == [row.key for row in table.where(rule='py:S1', type=['CODE_SMELL', 'VULNERABILITY'])]
+    assert 0 == len(table.where(severity='BLOCKER'))
+
+
+def test_count_by():
+    table = IssueTable.from_issues(ISSUES)
+    assert {'MAJOR': 2, 'MINOR': 1} == table.count_by('severity')
+    assert {'BUG': 1, 'CODE_SMELL': 1} == table.where(rule='py:S1').count_by('type')
+
+
+def test_measure_matrix_is_dense():
+    matrix = MeasureMatrix(['ncloc', 'coverage', 'alert_status'])
+    matrix.add(['a', 'b'], [{'component': 'a', 'metric': 'ncloc', 'value': '120'},
+                            {'component': 'b', 'metric': 'coverage', 'value': '81.5'},
+                            {'component': 'b', 'metric': 'alert_status', 'value': 'ERROR'},
+                            {'component': 'a', 'metric': 'new_bugs', 'period': {'value': '2'}}])
+    assert 120.0 == matrix.value('a', 'ncloc')
+    assert math.isnan(matrix.value('a', 'coverage'))
+    assert [81.5] == [v for v in matrix.column('coverage') if not math.isnan(v)]
+    assert {('b', 'alert_status'): 'ERROR'} == matrix.text
+
+
+def test_measure_history_aligns_metrics_and_skips_known_analyses():
+    history = MeasureHistory('p', ['ncloc', 'coverage'])
+    history.add([{'metric': 'ncloc', 'history': [{'date': '2022-01-01T00:00:00+0000', 'value': '10'},
+                                                 {'date': '2022-01-02T00:00:00+0000', 'value': '12'}]},
+                 {'metric': 'coverage', 'history': [{'date': '2022-01-02T00:00:00+0000', 'value': '50.5'}]}])
+    history.add([{'metric': 'ncloc', 'history': [{'date': '2022-01-02T00:00:00+0000', 'value': '12'},
+                                                 {'date': '2022-01-03T00:00:00+0000', 'value': '15'}]}])
+    assert [1640995200, 1641081600, 1641168000] == list(history.timestamps)
+    assert [10.0, 12.0, 15.0] == list(history.values['ncloc'])
+    assert 50.5 == history.values['coverage'][1]
+    assert math.isnan(history.values['coverage'][2])
+    assert '2022-01-03T00:00:00+0000' == history.last_date()